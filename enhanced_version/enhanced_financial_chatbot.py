@@ -1,13 +1,19 @@
 from dotenv import load_dotenv
-from anthropic import Anthropic
+from anthropic import AsyncAnthropic
 from mcp import ClientSession, StdioServerParameters, types
 from mcp.client.stdio import stdio_client
-from typing import List, Dict, TypedDict
+from typing import List, Dict, Optional, Tuple, TypedDict
 from contextlib import AsyncExitStack
+from collections import deque
+from functools import lru_cache
+from pathlib import Path
 import json
 import asyncio
+import os
 import re
 import logging
+import sys
+import time
 from datetime import datetime
 from guardrails import FinancialGuardrails, RiskLevel, GuardrailViolation, GuardrailViolationType
 
@@ -17,6 +23,94 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
+# Splits "/prompt" arguments into name and key=value / key="quoted value" parts
+_PROMPT_RE = re.compile(r'(\w+(?:=(?:"[^"]*"|[^\s]+))?)')
+
+# Plain upper-case tickers contain nothing sanitize_input would strip
+_TICKER_FAST_RE = re.compile(r'[A-Z]{1,5}')
+
+# Prompts the chatbot is allowed to execute (whitelist approach)
+_ALLOWED_PROMPTS = frozenset(('analyze_stock_prompt', 'portfolio_comparison_prompt'))
+
+# Static part of the system prompt; only the session footer varies per query
+_SYSTEM_PROMPT_BODY = """You are a financial data assistant with strict safety guidelines. IMPORTANT RULES:
+
+WHAT YOU CAN DO:
+- Provide factual, objective financial data and market information
+- Explain financial concepts and terminology
+- Analyze historical performance and trends
+- Compare financial metrics between companies
+- Discuss market conditions and economic indicators
+
+WHAT YOU CANNOT DO:
+- Give investment advice or recommendations (buy/sell/hold)
+- Predict future stock prices or market movements
+- Guarantee returns or suggest "sure things"
+- Provide trading strategies or timing advice
+- Recommend specific investments or portfolio allocations
+
+SAFETY REQUIREMENTS:
+- Always include appropriate disclaimers
+- Redirect investment advice requests to licensed financial professionals
+- Focus on education and data analysis, not predictions
+- Be transparent about data limitations and sources
+- Maintain objectivity and avoid speculation"""
+
+# [epoch second, ISO string] for the last timestamp handed out by _now_iso
+_TS_CACHE = [0, ""]
+
+def _now_iso() -> str:
+    """Current local time in ISO format, formatted at most once per second."""
+    second = int(time.time())
+    if second != _TS_CACHE[0]:
+        _TS_CACHE[0] = second
+        _TS_CACHE[1] = datetime.fromtimestamp(second).isoformat()
+    return _TS_CACHE[1]
+
+@lru_cache(maxsize=1)
+def _load_server_config(path: str) -> dict:
+    """Read and parse the MCP server configuration, once per path."""
+    return json.loads(Path(path).read_bytes())
+
+# Anthropic prompt-caching marker for the static tool schema and system prompt
+_CACHE_CONTROL = {"type": "ephemeral"}
+
+def _tool_result(tool_use_id: str, content) -> dict:
+    """Build a tool_result content block for the user turn that answers a tool_use."""
+    return {"type": "tool_result", "tool_use_id": tool_use_id, "content": content}
+
+# Bytes read from stdin beyond the last line handed out by _read_input
+_stdin_pending = bytearray()
+
+async def _read_input(prompt: str) -> str:
+    """
+    input() for the event loop: waits for stdin with add_reader, so no thread
+    is left blocked in input() when Ctrl-C stops the loop.
+    """
+    if sys.platform == "win32":
+        # The Windows event loop cannot watch stdin
+        return await asyncio.to_thread(input, prompt)
+    
+    print(prompt, end="", flush=True)
+    loop = asyncio.get_running_loop()
+    fd = sys.stdin.fileno()
+    while b"\n" not in _stdin_pending:
+        ready = loop.create_future()
+        loop.add_reader(fd, lambda: ready.done() or ready.set_result(None))
+        try:
+            await ready
+        finally:
+            loop.remove_reader(fd)
+        chunk = os.read(fd, 4096)
+        if not chunk:
+            if not _stdin_pending:
+                raise EOFError
+            chunk = b"\n"
+        _stdin_pending.extend(chunk)
+    line, _, rest = _stdin_pending.partition(b"\n")
+    _stdin_pending[:] = rest
+    return line.decode(sys.stdin.encoding or "utf-8", errors="replace").rstrip("\r")
+
 class ToolDefinition(TypedDict):
     name: str
     description: str
@@ -31,84 +125,142 @@ class FinancialChatBot:
         # Initialize session and client objects
         self.sessions: List[ClientSession] = []
         self.exit_stack = AsyncExitStack()
-        self.anthropic = Anthropic()
+        self.anthropic = AsyncAnthropic()
         self.available_tools: List[ToolDefinition] = []
+        # Frozen copy of available_tools sent to Claude, built once all servers are connected
+        self._tools_payload: Tuple[dict, ...] = ()
         self.tool_to_session: Dict[str, ClientSession] = {}
+        self.resource_to_session: Dict[str, ClientSession] = {}
+        self.resource_templates: List[Tuple[re.Pattern, ClientSession]] = []
+        self.prompt_to_session: Dict[str, ClientSession] = {}
         self.available_resources: List[str] = []
         self.available_prompts: List[str] = []
         
         # Initialize guardrails with configuration
         self.guardrails = FinancialGuardrails(guardrails_config_path)
+        self._max_response_length = self.guardrails.config["response_filtering"]["max_response_length"]
         
         # Generate session ID for this chatbot instance
         self.session_id = self.guardrails.get_session_id("chatbot_session")
         
-        # Track conversation context for better safety
-        self.conversation_history = []
+        # Track conversation context for better safety (last 10 interactions)
+        self.conversation_history = deque(maxlen=10)
+        
+        # Chat commands by prefix, checked in order ('/prompts' before '/prompt ')
+        self._command_handlers = (
+            ('@', self._handle_resource_command),
+            ('/prompts', self._handle_prompts_command),
+            ('/prompt ', self._handle_prompt_command),
+        )
+        self._command_prefixes = tuple(prefix for prefix, _ in self._command_handlers)
+        
+        # System prompts memoized per risk level (session ID is fixed per instance)
+        self._system_prompts: Dict[RiskLevel, List[dict]] = {}
         
         logger.info(f"Initialized Financial Chatbot with session ID: {self.session_id}")
 
-    async def connect_to_server(self, server_name: str, server_config: dict) -> None:
-        """Connect to a single MCP server with error handling."""
-        try:
-            server_params = StdioServerParameters(**server_config)
-            stdio_transport = await self.exit_stack.enter_async_context(
-                stdio_client(server_params)
-            )
-            read, write = stdio_transport
-            session = await self.exit_stack.enter_async_context(
-                ClientSession(read, write)
-            )
-            await session.initialize()
-            self.sessions.append(session)
-            
-            # List available tools for this session
-            response = await session.list_tools()
-            tools = response.tools
-            print(f"\nConnected to {server_name} with tools:", [t.name for t in tools])
-            
-            for tool in tools:
-                self.tool_to_session[tool.name] = session
-                self.available_tools.append({
-                    "name": tool.name,
-                    "description": tool.description,
-                    "input_schema": tool.inputSchema
-                })
-            
-            # List available resources
-            try:
-                resources_response = await session.list_resources()
-                resources = resources_response.resources
-                for resource in resources:
-                    self.available_resources.append(resource.uri)
-                print(f"Available resources from {server_name}:", [r.uri for r in resources])
-            except Exception as e:
-                logger.info(f"No resources available from {server_name}: {e}")
-            
-            # List available prompts
-            try:
-                prompts_response = await session.list_prompts()
-                prompts = prompts_response.prompts
-                for prompt in prompts:
-                    self.available_prompts.append(prompt.name)
-                print(f"Available prompts from {server_name}:", [p.name for p in prompts])
-            except Exception as e:
-                logger.info(f"No prompts available from {server_name}: {e}")
-                
-        except Exception as e:
-            print(f"Failed to connect to {server_name}: {e}")
-            logger.error(f"Connection error for {server_name}: {e}")
+    async def _open_session(self, server_config: dict) -> ClientSession:
+        """
+        Start a server process and open its client session.
+        Must run in the task that later closes exit_stack: the stdio transport
+        cannot be closed from a different task than the one that opened it.
+        """
+        server_params = StdioServerParameters(**server_config)
+        read, write = await self.exit_stack.enter_async_context(
+            stdio_client(server_params)
+        )
+        return await self.exit_stack.enter_async_context(
+            ClientSession(read, write)
+        )
+
+    async def _register_session(self, server_name: str, session: ClientSession) -> None:
+        """Initialize a session and register its tools, resources and prompts."""
+        await session.initialize()
+        self.sessions.append(session)
+        
+        # Discover tools, resources, templates and prompts in one round trip;
+        # servers without resources/prompts answer those requests with errors
+        (tools_response, resources_response,
+         templates_response, prompts_response) = await asyncio.gather(
+            session.list_tools(),
+            session.list_resources(),
+            session.list_resource_templates(),
+            session.list_prompts(),
+            return_exceptions=True
+        )
+        
+        # Tools are required; failing to list them fails the connection
+        if isinstance(tools_response, BaseException):
+            raise tools_response
+        tools = tools_response.tools
+        print(f"\nConnected to {server_name} with tools:", [t.name for t in tools])
+        
+        for tool in tools:
+            self.tool_to_session[tool.name] = session
+            self.available_tools.append({
+                "name": tool.name,
+                "description": tool.description,
+                "input_schema": tool.inputSchema
+            })
+        
+        # Register available resources
+        if isinstance(resources_response, BaseException):
+            logger.info(f"No resources available from {server_name}: {resources_response}")
+        else:
+            resources = resources_response.resources
+            for resource in resources:
+                self.resource_to_session[str(resource.uri)] = session
+                self.available_resources.append(resource.uri)
+            print(f"Available resources from {server_name}:", [r.uri for r in resources])
+        
+        # Register resource templates (e.g. finance://{filename})
+        if isinstance(templates_response, BaseException):
+            logger.info(f"No resource templates available from {server_name}: {templates_response}")
+        else:
+            for template in templates_response.resourceTemplates:
+                self.resource_templates.append(
+                    (self._compile_uri_template(template.uriTemplate), session)
+                )
+        
+        # Register available prompts
+        if isinstance(prompts_response, BaseException):
+            logger.info(f"No prompts available from {server_name}: {prompts_response}")
+        else:
+            prompts = prompts_response.prompts
+            for prompt in prompts:
+                self.prompt_to_session[prompt.name] = session
+                self.available_prompts.append(prompt.name)
+            print(f"Available prompts from {server_name}:", [p.name for p in prompts])
 
     async def connect_to_servers(self):
         """Connect to all configured MCP servers."""
         try:
-            with open("server_config.json", "r") as file:
-                data = json.load(file)
+            data = await asyncio.to_thread(_load_server_config, "server_config.json")
             
             servers = data.get("mcpServers", {})
-            
+
+            # Start the server processes from this task (see _open_session);
+            # spawning is quick, the handshakes below are the slow part
+            opened = []
             for server_name, server_config in servers.items():
-                await self.connect_to_server(server_name, server_config)
+                try:
+                    opened.append((server_name, await self._open_session(server_config)))
+                except Exception as e:
+                    print(f"Failed to connect to {server_name}: {e}")
+                    logger.error(f"Connection error for {server_name}: {e}")
+            
+            # Handshake and discover concurrently; registration has no awaits
+            # between mutations, so the shared lists stay consistent
+            results = await asyncio.gather(
+                *(self._register_session(name, session) for name, session in opened),
+                return_exceptions=True
+            )
+            for (server_name, _), result in zip(opened, results):
+                if isinstance(result, BaseException):
+                    print(f"Failed to connect to {server_name}: {result}")
+                    logger.error(f"Connection error for {server_name}: {result}")
+            
+            self._tools_payload = self._build_tools_payload()
         except Exception as e:
             print(f"Error loading server configuration: {e}")
             logger.error(f"Server configuration error: {e}")
@@ -121,35 +273,50 @@ class FinancialChatBot:
             if not resource_uri.startswith('finance://'):
                 return "⚠️ Error: Only finance resources are allowed for security reasons"
             
-            # Find the session that provides this resource
-            for session in self.sessions:
-                try:
-                    result = await session.read_resource(resource_uri)
-                    content = result.contents[0].text if result.contents else "No content available"
-                    
-                    # Add disclaimer to resource content
-                    disclaimer = "\n\n📋 Note: This financial data is for informational purposes only and should not be considered as investment advice."
-                    return content + disclaimer
-                except Exception:
-                    continue
-            return f"Resource not found: {resource_uri}"
+            session = self._find_resource_session(resource_uri)
+            if session is None:
+                return f"Resource not found: {resource_uri}"
+            
+            result = await session.read_resource(resource_uri)
+            content = result.contents[0].text if result.contents else "No content available"
+            
+            # Add disclaimer to resource content
+            disclaimer = "\n\n📋 Note: This financial data is for informational purposes only and should not be considered as investment advice."
+            return content + disclaimer
         except Exception as e:
             return f"Error retrieving resource: {str(e)}"
 
+    @staticmethod
+    def _compile_uri_template(uri_template: str) -> re.Pattern:
+        """Turn an RFC 6570 style template like finance://{filename} into a regex."""
+        return re.compile(re.sub(r'\\\{\w+\\\}', r'[^/]+', re.escape(uri_template)) + '$')
+
+    def _find_resource_session(self, resource_uri: str) -> Optional[ClientSession]:
+        """Look up the session that serves a resource URI."""
+        session = self.resource_to_session.get(resource_uri)
+        if session is not None:
+            return session
+        for pattern, template_session in self.resource_templates:
+            if pattern.match(resource_uri):
+                return template_session
+        return None
+
     async def execute_prompt(self, prompt_name: str, arguments: Dict[str, str]) -> str:
         """Execute a prompt template with given arguments and validation."""
         try:
             # Validate prompt name (whitelist approach)
-            allowed_prompts = ['analyze_stock_prompt', 'portfolio_comparison_prompt']
-            if prompt_name not in allowed_prompts:
+            if prompt_name not in _ALLOWED_PROMPTS:
                 return f"⚠️ Prompt '{prompt_name}' is not allowed for security reasons"
             
             # Validate and clean arguments
             clean_arguments = {}
             for key, value in arguments.items():
-                # Sanitize input
-                clean_value = self.guardrails.sanitize_input(str(value))
-                clean_arguments[key] = clean_value
+                value = str(value)
+                if _TICKER_FAST_RE.fullmatch(value):
+                    clean_arguments[key] = value
+                else:
+                    # Sanitize input
+                    clean_arguments[key] = self.guardrails.sanitize_input(value)
             
             # Additional validation for symbol arguments
             if 'symbol' in clean_arguments:
@@ -159,27 +326,26 @@ class FinancialChatBot:
                     return f"⚠️ Error: {error_msg}"
                 clean_arguments['symbol'] = cleaned_symbols[0] if cleaned_symbols else clean_arguments['symbol']
             
-            # Find the session that provides this prompt
-            for session in self.sessions:
-                try:
-                    result = await session.get_prompt(prompt_name, clean_arguments)
-                    if result.messages:
-                        # Extract the prompt content and send to LLM
-                        prompt_content = ""
-                        for message in result.messages:
-                            if hasattr(message, 'content'):
-                                if hasattr(message.content, 'text'):
-                                    prompt_content += message.content.text
-                                else:
-                                    prompt_content += str(message.content)
-                        
-                        # Process the prompt with the LLM
-                        await self.process_query(prompt_content)
-                        return ""
-                    return "No prompt content received"
-                except Exception:
-                    continue
-            return f"Prompt not found: {prompt_name}"
+            session = self.prompt_to_session.get(prompt_name)
+            if session is None:
+                return f"Prompt not found: {prompt_name}"
+            
+            result = await session.get_prompt(prompt_name, clean_arguments)
+            if result.messages:
+                # Extract the prompt content and send to LLM
+                prompt_parts = []
+                for message in result.messages:
+                    if hasattr(message, 'content'):
+                        if hasattr(message.content, 'text'):
+                            prompt_parts.append(message.content.text)
+                        else:
+                            prompt_parts.append(str(message.content))
+                prompt_content = "".join(prompt_parts)
+                
+                # Process the prompt with the LLM
+                await self.process_query(prompt_content)
+                return ""
+            return "No prompt content received"
         except Exception as e:
             return f"Error executing prompt: {str(e)}"
 
@@ -188,21 +354,20 @@ class FinancialChatBot:
         if not self.available_prompts:
             return "No prompts available."
         
-        content = "Available prompts:\n"
-        for prompt in self.available_prompts:
-            content += f"- {prompt}\n"
-        content += "\nUsage: /prompt <name> <arg1=value1> <arg2=value2>"
-        content += "\n\n⚠️ All prompts are for informational purposes only and not investment advice."
-        content += "\n📋 All inputs are automatically validated and sanitized for security."
-        return content
+        parts = ["Available prompts:"]
+        parts.extend(f"- {prompt}" for prompt in self.available_prompts)
+        parts.append("\nUsage: /prompt <name> <arg1=value1> <arg2=value2>")
+        parts.append("\n⚠️ All prompts are for informational purposes only and not investment advice.")
+        parts.append("📋 All inputs are automatically validated and sanitized for security.")
+        return "\n".join(parts)
 
     def parse_prompt_command(self, user_input: str) -> tuple:
-        """Parse prompt command from user input with validation."""
+        """Parse prompt command from user input (arguments are sanitized in execute_prompt)."""
         # Remove /prompt prefix
-        command = user_input[7:].strip()  # Remove '/prompt '
+        command = user_input.removeprefix('/prompt').strip()
         
         # Split by spaces but handle quoted arguments
-        parts = re.findall(r'(\w+(?:=(?:"[^"]*"|[^\s]+))?)', command)
+        parts = _PROMPT_RE.findall(command)
         
         if not parts:
             return None, {}
@@ -216,8 +381,6 @@ class FinancialChatBot:
                 # Remove quotes if present
                 if value.startswith('"') and value.endswith('"'):
                     value = value[1:-1]
-                # Sanitize value using guardrails
-                value = self.guardrails.sanitize_input(value)
                 arguments[key] = value
         
         return prompt_name, arguments
@@ -243,155 +406,39 @@ class FinancialChatBot:
             
             # 4. Add query to conversation history (limited size for privacy)
             self.conversation_history.append({
-                'timestamp': datetime.now().isoformat(),
+                'timestamp': _now_iso(),
                 'query': query[:200],  # Truncate for privacy
                 'risk_level': risk_level.value,
                 'session_id': self.session_id
             })
             
-            # Keep only last 10 interactions
-            if len(self.conversation_history) > 10:
-                self.conversation_history.pop(0)
-            
             messages = [{'role':'user', 'content':query}]
             
             # 5. Enhanced system prompt for Claude with guardrails context
-            system_prompt = f"""You are a financial data assistant with strict safety guidelines. IMPORTANT RULES:
-
-WHAT YOU CAN DO:
-- Provide factual, objective financial data and market information
-- Explain financial concepts and terminology
-- Analyze historical performance and trends
-- Compare financial metrics between companies
-- Discuss market conditions and economic indicators
-
-WHAT YOU CANNOT DO:
-- Give investment advice or recommendations (buy/sell/hold)
-- Predict future stock prices or market movements
-- Guarantee returns or suggest "sure things"
-- Provide trading strategies or timing advice
-- Recommend specific investments or portfolio allocations
-
-SAFETY REQUIREMENTS:
-- Always include appropriate disclaimers
-- Redirect investment advice requests to licensed financial professionals
-- Focus on education and data analysis, not predictions
-- Be transparent about data limitations and sources
-- Maintain objectivity and avoid speculation
-
-Current session risk level: {risk_level.value}
-Session ID: {self.session_id}"""
+            system_prompt = self._get_system_prompt(risk_level)
             
-            response = self.anthropic.messages.create(
-                max_tokens = 4096,
-                model = 'claude-3-5-sonnet-20241022',
-                system = system_prompt,
-                tools = self.available_tools,
-                messages = messages
-            )
+            response = await self._stream_message(system_prompt, messages)
             
-            process_query = True
-            while process_query:
-                assistant_content = []
-                for content in response.content:
-                    if content.type =='text':
-                        # Add disclaimer based on risk level using guardrails
-                        final_response = self.guardrails.add_disclaimer(content.text, risk_level)
-                        print(final_response)
-                        assistant_content.append(content)
-                        if(len(response.content) == 1):
-                            process_query= False
-                    elif content.type == 'tool_use':
-                        assistant_content.append(content)
-                        messages.append({'role':'assistant', 'content':assistant_content})
-                        tool_id = content.id
-                        tool_args = content.input
-                        tool_name = content.name
-
-                        print(f"\n🔧 Calling tool {tool_name} with args {tool_args}")
-                        
-                        # 6. Tool-specific validation using guardrails
-                        valid_tool, tool_error = self.guardrails.validate_tool_call(tool_name, tool_args)
-                        if not valid_tool:
-                            error_msg = f"Tool call blocked by safety checks: {tool_error}"
-                            print(f"❌ {error_msg}")
-                            
-                            # Log the violation
-                            violation = GuardrailViolation(
-                                violation_type=GuardrailViolationType.INVALID_SYMBOL,
-                                message=tool_error,
-                                risk_level=RiskLevel.MEDIUM,
-                                details={"tool_name": tool_name, "args": tool_args}
-                            )
-                            self.guardrails.log_violation(violation, self.session_id)
-                            
-                            messages.append({"role": "user", 
-                                              "content": [
-                                                  {
-                                                      "type": "tool_result",
-                                                      "tool_use_id":tool_id,
-                                                      "content": error_msg
-                                                  }
-                                              ]
-                                            })
-                        else:
-                            # Add session_id to tool arguments for server-side tracking
-                            enhanced_tool_args = {**tool_args, "session_id": self.session_id}
-                            
-                            # Call a tool using the appropriate session
-                            try:
-                                session = self.tool_to_session[tool_name]
-                                result = await session.call_tool(tool_name, arguments=enhanced_tool_args)
-                                print(f"✅ Tool result received")
-                                
-                                # Parse and validate tool response
-                                tool_response = self._process_tool_response(result.content, tool_name, risk_level)
-                                
-                                messages.append({"role": "user", 
-                                                  "content": [
-                                                      {
-                                                          "type": "tool_result",
-                                                          "tool_use_id":tool_id,
-                                                          "content": tool_response
-                                                      }
-                                                  ]
-                                                })
-                            except Exception as e:
-                                error_msg = f"Error calling tool {tool_name}: {str(e)}"
-                                print(f"❌ {error_msg}")
-                                logger.error(f"Tool error: {e}")
-                                
-                                # Log the error
-                                violation = GuardrailViolation(
-                                    violation_type=GuardrailViolationType.EXCESSIVE_REQUEST,
-                                    message=f"Tool execution failed: {str(e)}",
-                                    risk_level=RiskLevel.MEDIUM,
-                                    details={"tool_name": tool_name, "error": str(e)}
-                                )
-                                self.guardrails.log_violation(violation, self.session_id)
-                                
-                                messages.append({"role": "user", 
-                                                  "content": [
-                                                      {
-                                                          "type": "tool_result",
-                                                          "tool_use_id":tool_id,
-                                                          "content": error_msg
-                                                      }
-                                                  ]
-                                                })
-                        
-                        response = self.anthropic.messages.create(
-                            max_tokens = 4096,
-                            model = 'claude-3-5-sonnet-20241022',
-                            system = system_prompt,
-                            tools = self.available_tools,
-                            messages = messages
-                        ) 
-                        
-                        if(len(response.content) == 1 and response.content[0].type == "text"):
-                            final_response = self.guardrails.add_disclaimer(response.content[0].text, risk_level)
-                            print(final_response)
-                            process_query= False
+            while True:
+                tool_uses = [content for content in response.content if content.type == 'tool_use']
+                if any(content.type == 'text' for content in response.content):
+                    # Text was printed while streaming; close it with the risk-based disclaimer
+                    print(self.guardrails.get_disclaimer(risk_level))
+                
+                if not tool_uses:
+                    break
+                
+                # The assistant turn is echoed back exactly as Claude sent it
+                messages.append({'role':'assistant', 'content':list(response.content)})
+                
+                # 6. Run every tool requested in this turn concurrently;
+                # _invoke_tool turns failures into tool_result blocks itself
+                tool_results = await asyncio.gather(
+                    *(self._invoke_tool(content, risk_level) for content in tool_uses)
+                )
+                messages.append({'role':'user', 'content':list(tool_results)})
+                
+                response = await self._stream_message(system_prompt, messages)
                             
         except Exception as e:
             print(f"❌ Error processing query: {str(e)}")
@@ -406,39 +453,148 @@ Session ID: {self.session_id}"""
             )
             self.guardrails.log_violation(violation, self.session_id)
 
+    async def _stream_message(self, system_prompt: List[dict], messages: list):
+        """Stream a Claude response to stdout as it arrives and return the final message."""
+        async with self.anthropic.messages.stream(
+            max_tokens = 4096,
+            model = 'claude-3-5-sonnet-20241022',
+            system = system_prompt,
+            tools = self._tools_payload,
+            messages = messages
+        ) as stream:
+            async for text in stream.text_stream:
+                print(text, end="", flush=True)
+            return await stream.get_final_message()
+
+    async def _invoke_tool(self, content, risk_level: RiskLevel) -> dict:
+        """Validate and run a single tool_use block, returning its tool_result block."""
+        tool_id = content.id
+        tool_args = content.input
+        tool_name = content.name
+
+        print(f"\n🔧 Calling tool {tool_name} with args {tool_args}")
+        
+        # Tool-specific validation using guardrails
+        valid_tool, tool_error = self.guardrails.validate_tool_call(tool_name, tool_args)
+        if not valid_tool:
+            error_msg = f"Tool call blocked by safety checks: {tool_error}"
+            print(f"❌ {error_msg}")
+            
+            # Log the violation
+            violation = GuardrailViolation(
+                violation_type=GuardrailViolationType.INVALID_SYMBOL,
+                message=tool_error,
+                risk_level=RiskLevel.MEDIUM,
+                details={"tool_name": tool_name, "args": tool_args}
+            )
+            self.guardrails.log_violation(violation, self.session_id)
+            
+            return _tool_result(tool_id, error_msg)
+        
+        # Add session_id to tool arguments for server-side tracking
+        enhanced_tool_args = {**tool_args, "session_id": self.session_id}
+        
+        # Call a tool using the appropriate session
+        try:
+            session = self.tool_to_session[tool_name]
+            result = await session.call_tool(tool_name, arguments=enhanced_tool_args)
+            print(f"✅ Tool result received")
+            
+            # Parse and validate tool response
+            tool_response = self._process_tool_response(result.content, tool_name, risk_level)
+            
+            return _tool_result(tool_id, tool_response)
+        except Exception as e:
+            error_msg = f"Error calling tool {tool_name}: {str(e)}"
+            print(f"❌ {error_msg}")
+            logger.error(f"Tool error: {e}")
+            
+            # Log the error
+            violation = GuardrailViolation(
+                violation_type=GuardrailViolationType.EXCESSIVE_REQUEST,
+                message=f"Tool execution failed: {str(e)}",
+                risk_level=RiskLevel.MEDIUM,
+                details={"tool_name": tool_name, "error": str(e)}
+            )
+            self.guardrails.log_violation(violation, self.session_id)
+            
+            return _tool_result(tool_id, error_msg)
+
+    def _get_system_prompt(self, risk_level: RiskLevel) -> List[dict]:
+        """Return the system prompt blocks for the given risk level, building them once."""
+        system_prompt = self._system_prompts.get(risk_level)
+        if system_prompt is None:
+            text = (
+                f"{_SYSTEM_PROMPT_BODY}\n\n"
+                f"Current session risk level: {risk_level.value}\n"
+                f"Session ID: {self.session_id}"
+            )
+            # Mark the prompt cacheable so repeated turns reuse Anthropic's cached prefix
+            system_prompt = [{"type": "text", "text": text, "cache_control": _CACHE_CONTROL}]
+            self._system_prompts[risk_level] = system_prompt
+        return system_prompt
+
+    def _build_tools_payload(self) -> Tuple[dict, ...]:
+        """Freeze available_tools for Claude, marking the last tool as a cache breakpoint."""
+        tools = [dict(tool) for tool in self.available_tools]
+        if tools:
+            tools[-1]["cache_control"] = _CACHE_CONTROL
+        return tuple(tools)
+
+    def _guardrails_info(self, tool_name: str, risk_level: RiskLevel) -> dict:
+        """Guardrails metadata attached to JSON tool responses."""
+        return {
+            'validated': True,
+            'risk_level': risk_level.value,
+            'session_id': self.session_id,
+            'tool_name': tool_name,
+            'timestamp': _now_iso()
+        }
+
     def _process_tool_response(self, response_content, tool_name: str, risk_level: RiskLevel) -> str:
         """Process and validate tool responses"""
         try:
             # Handle different response types
             if isinstance(response_content, list):
-                # If it's a list, convert to string
-                response_str = str(response_content[0]) if response_content else ""
+                if response_content and hasattr(response_content[0], 'text'):
+                    # MCP TextContent: use the payload directly
+                    response_str = response_content[0].text
+                else:
+                    # If it's a list, convert to string
+                    response_str = str(response_content[0]) if response_content else ""
             elif isinstance(response_content, str):
                 response_str = response_content
             else:
                 response_str = str(response_content)
             
-            # Try to parse as JSON to add metadata
-            try:
-                response_data = json.loads(response_str)
-                if isinstance(response_data, dict):
-                    # Add guardrails metadata to response
-                    response_data['guardrails_info'] = {
-                        'validated': True,
-                        'risk_level': risk_level.value,
-                        'session_id': self.session_id,
-                        'tool_name': tool_name,
-                        'timestamp': datetime.now().isoformat()
-                    }
-                    return json.dumps(response_data, indent=2)
-            except json.JSONDecodeError:
-                # Not JSON, return as-is with disclaimer
-                pass
-            
-            # Add basic disclaimer for non-JSON responses
-            max_length = self.guardrails.config["response_filtering"]["max_response_length"]
+            # Enforce the size budget before any parsing, so an oversized
+            # payload is never decoded or re-encoded
+            max_length = self._max_response_length
+            is_json = response_str.lstrip()[:1] in ('{', '[')
             if len(response_str) > max_length:
-                response_str = response_str[:max_length] + "... [response truncated for safety]"
+                if is_json:
+                    # Sliced JSON would reach the model broken; send a small notice instead
+                    return json.dumps({
+                        'error': 'response too large',
+                        'size': len(response_str),
+                        'max_size': max_length,
+                        'guardrails_info': self._guardrails_info(tool_name, risk_level)
+                    }, separators=(',', ':'))
+                return response_str[:max_length] + "... [response truncated for safety]"
+            
+            # Only text that looks like JSON is parsed; objects get metadata
+            if is_json:
+                try:
+                    response_data = json.loads(response_str)
+                except json.JSONDecodeError:
+                    # Not JSON, return as-is
+                    pass
+                else:
+                    if isinstance(response_data, dict):
+                        # Add guardrails metadata to response
+                        response_data['guardrails_info'] = self._guardrails_info(tool_name, risk_level)
+                        # Compact separators: this goes to the model, not a human
+                        return json.dumps(response_data, separators=(',', ':'))
             
             return response_str
             
@@ -446,6 +602,39 @@ Session ID: {self.session_id}"""
             logger.error(f"Error processing tool response: {e}")
             return f"Error processing response: {str(e)}"
 
+    def _show_status(self) -> None:
+        """Print guardrails statistics for this session."""
+        stats = self.guardrails.get_session_stats(self.session_id)
+        print("\n📊 Session Statistics:")
+        print(f"  • Total requests: {stats['total_requests']}")
+        print(f"  • Rate limits: {stats['rate_limits']}")
+        print(f"  • Violations: {len(stats['violations'])}")
+        if stats['violations']:
+            print("  • Recent violations:")
+            for violation in stats['violations'][-3:]:  # Show last 3
+                print(f"    - {violation['type']}: {violation['message'][:50]}...")
+
+    async def _handle_resource_command(self, query: str) -> None:
+        """Handle @portfolios and @<filename> resource requests."""
+        resource_name = query[1:]
+        if resource_name == 'portfolios':
+            result = await self.get_resource("finance://portfolios")
+        else:
+            result = await self.get_resource(f"finance://{resource_name}")
+        print(result)
+
+    async def _handle_prompts_command(self, query: str) -> None:
+        """Handle /prompts."""
+        print(self.list_prompts())
+
+    async def _handle_prompt_command(self, query: str) -> None:
+        """Handle /prompt <name> <args>."""
+        prompt_name, arguments = self.parse_prompt_command(query)
+        if prompt_name:
+            await self.execute_prompt(prompt_name, arguments)
+        else:
+            print("❌ Invalid prompt format. Use: /prompt <n> <arg1=value1>")
+
     async def chat_loop(self):
         """Run an interactive chat loop with enhanced safety features."""
         print("\n💰 Financial MCP Chatbot Started!")
@@ -474,54 +663,29 @@ Session ID: {self.session_id}"""
         
         while True:
             try:
-                query = input("\n💭 Query: ").strip()
+                query = (await _read_input("\n💭 Query: ")).strip()
         
-                if query.lower() == 'quit':
+                query_lower = query.lower()
+                if query_lower == 'quit':
                     print("👋 Goodbye!")
                     break
                 
                 # Handle status requests
-                if query.lower() == '/status':
-                    stats = self.guardrails.get_session_stats(self.session_id)
-                    print("\n📊 Session Statistics:")
-                    print(f"  • Total requests: {stats['total_requests']}")
-                    print(f"  • Rate limits: {stats['rate_limits']}")
-                    print(f"  • Violations: {len(stats['violations'])}")
-                    if stats['violations']:
-                        print("  • Recent violations:")
-                        for violation in stats['violations'][-3:]:  # Show last 3
-                            print(f"    - {violation['type']}: {violation['message'][:50]}...")
+                if query_lower == '/status':
+                    self._show_status()
                     continue
                 
-                # Handle resource requests (@)
-                if query.startswith('@'):
-                    resource_name = query[1:]
-                    if resource_name == 'portfolios':
-                        result = await self.get_resource("finance://portfolios")
-                    else:
-                        result = await self.get_resource(f"finance://{resource_name}")
-                    print(result)
-                    continue
-                
-                # Handle prompt commands (/)
-                if query.startswith('/prompts'):
-                    print(self.list_prompts())
-                    continue
-                
-                if query.startswith('/prompt '):
-                    prompt_name, arguments = self.parse_prompt_command(query)
-                    if prompt_name:
-                        await self.execute_prompt(prompt_name, arguments)
-                    else:
-                        print("❌ Invalid prompt format. Use: /prompt <n> <arg1=value1>")
+                # Handle resource (@) and prompt (/) commands
+                if query.startswith(self._command_prefixes):
+                    for prefix, handler in self._command_handlers:
+                        if query.startswith(prefix):
+                            await handler(query)
+                            break
                     continue
                 
                 # Regular query processing with safety checks
                 await self.process_query(query)
                         
-            except KeyboardInterrupt:
-                print("\n👋 Goodbye!")
-                break
             except Exception as e:
                 print(f"\n❌ Error: {str(e)}")
                 logger.error(f"Chat loop error: {e}")
@@ -557,7 +721,10 @@ Session ID: {self.session_id}"""
         except Exception as e:
             logger.error(f"Error generating final statistics: {e}")
         
+        # The single exit stack owns every MCP session opened in _open_session
         await self.exit_stack.aclose()
+        logger.info(f"Closed {len(self.sessions)} MCP session(s)")
+        self.sessions.clear()
         print("🧹 Cleaned up all connections")
         print("🛡️ Guardrails session terminated safely")
 
@@ -575,4 +742,8 @@ async def main():
         await chatbot.cleanup()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        # Ctrl-C: main() has already cleaned up on the way out
+        print("\n👋 Goodbye!")
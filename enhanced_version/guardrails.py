@@ -4,19 +4,56 @@ Comprehensive security and safety measures for financial applications
 """
 
 import re
-import json
 import logging
 import time
 import hashlib
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+from collections import OrderedDict
 from dataclasses import dataclass, field
 from enum import Enum
-from typing import List, Dict, Optional, Tuple, Set
+from functools import lru_cache
+from typing import List, Dict, FrozenSet, Optional, Tuple, Set
 from pathlib import Path
 
+try:
+    from orjson import loads as json_loads
+except ImportError:  # orjson is an optional speedup
+    from json import loads as json_loads
+
 # Set up logging
 logger = logging.getLogger(__name__)
 
+# Rate limit windows in nanoseconds (compared against time.monotonic_ns())
+_MINUTE_NS = 60 * 1_000_000_000
+_HOUR_NS = 60 * _MINUTE_NS
+_DAY_NS = 24 * _HOUR_NS
+
+# Most sessions kept in rate_limiters / session_data before the least recently used is evicted
+_MAX_TRACKED_SESSIONS = 10_000
+
+# Historical data periods accepted by yfinance, in days
+_PERIOD_DAYS = {
+    '1d': 1, '5d': 5, '1mo': 30, '3mo': 90, '6mo': 180,
+    '1y': 365, '2y': 730, '5y': 1825, '10y': 3650, 'max': 7300
+}
+
+# Characters stripped by sanitize_input
+_SANITIZE_TABLE = str.maketrans('', '', '<>"\';\\')
+
+# Words that raise an otherwise low-risk query to medium risk
+_SPECULATIVE_WORDS = ('volatile', 'risky', 'speculation', 'gamble')
+
+def _compile_alternation(patterns: List[str], escape: bool = True) -> re.Pattern:
+    """
+    Compile several patterns into one case-insensitive alternation.
+    Literal terms are escaped and ordered longest first so the longest term wins.
+    """
+    if escape:
+        patterns = [re.escape(p) for p in sorted(patterns, key=len, reverse=True)]
+    if not patterns:
+        return re.compile(r'(?!)')  # matches nothing
+    return re.compile('|'.join(f'(?:{p})' for p in patterns), re.IGNORECASE)
+
 class RiskLevel(Enum):
     LOW = "low"
     MEDIUM = "medium" 
@@ -32,23 +69,25 @@ class GuardrailViolationType(Enum):
     EXCESSIVE_REQUEST = "excessive_request"
     BLOCKED_CONTENT = "blocked_content"
 
-@dataclass
+@dataclass(slots=True)
 class GuardrailViolation:
     violation_type: GuardrailViolationType
     message: str
     risk_level: RiskLevel
-    timestamp: datetime = field(default_factory=datetime.now)
+    timestamp: Optional[datetime] = None  # set by log_violation
     details: Optional[Dict] = None
 
-@dataclass
+@dataclass(slots=True)
 class RateLimitTracker:
     """Track API call rates per user/session"""
-    calls_per_minute: int = 0
+    # Per-minute limit: lazily refilled token bucket
+    tokens: float = 0.0
+    last_refill: int = field(default_factory=time.monotonic_ns)
+    # Hour/day limits: fixed windows, start times in time.monotonic_ns() units
     calls_per_hour: int = 0
     calls_per_day: int = 0
-    last_reset_minute: datetime = field(default_factory=datetime.now)
-    last_reset_hour: datetime = field(default_factory=datetime.now)
-    last_reset_day: datetime = field(default_factory=datetime.now)
+    last_reset_hour: int = field(default_factory=time.monotonic_ns)
+    last_reset_day: int = field(default_factory=time.monotonic_ns)
     violations: List[GuardrailViolation] = field(default_factory=list)
 
 class FinancialGuardrails:
@@ -57,15 +96,64 @@ class FinancialGuardrails:
     Can be used by both client and server components.
     """
     
+    __slots__ = (
+        'config', 'rate_limiters', 'blocked_symbols', 'session_data',
+        '_session_date', '_session_date_checked', 'allowed_periods',
+        'investment_advice_re', 'blocked_keyword_names', 'term_scan_re',
+        'speculative_re', 'symbol_fullmatch', 'injection_patterns', 'injection_re',
+        '_validate_symbols_cached', '_max_input_length', '_sanitize_inputs',
+        '_log_violations', '_add_disclaimers', '_max_symbols_per_request',
+        '_max_calls_per_minute', '_max_calls_per_hour', '_max_calls_per_day',
+        '_allowed_intervals', '_allowed_intervals_text', '_max_symbols_in_comparison',
+    )
+    
+    _DISCLAIMERS: Dict[RiskLevel, str] = {
+        RiskLevel.LOW: "\n\n📋 Note: This information is for educational purposes only and should not be considered as investment advice.",
+        RiskLevel.MEDIUM: "\n\n⚠️ Disclaimer: This data is for informational purposes only and not investment advice. Market conditions can change rapidly. Please consult a financial advisor.",
+        RiskLevel.HIGH: "\n\n🚨 Important: This involves high-risk financial concepts. Please consult a licensed financial advisor before making any investment decisions. Past performance does not guarantee future results.",
+        RiskLevel.CRITICAL: "\n\n🛑 Critical Warning: This involves extremely high-risk financial instruments that can result in significant losses. Seek professional advice and understand all risks before proceeding. Only invest what you can afford to lose."
+    }
+    
     def __init__(self, config_path: Optional[str] = None):
         self.config = self._load_config(config_path)
-        self.rate_limiters: Dict[str, RateLimitTracker] = {}
-        self.blocked_symbols: Set[str] = set(self.config.get('blocked_symbols', []))
-        self.session_data: Dict[str, Dict] = {}
+        
+        # Config values read on every request, bound once
+        config = self.config
+        self._max_input_length = config["security"]["max_input_length"]
+        self._sanitize_inputs = config["security"]["sanitize_inputs"]
+        self._log_violations = config["security"]["log_violations"]
+        self._add_disclaimers = config["response_filtering"]["add_disclaimers"]
+        self._max_symbols_per_request = config["symbol_validation"]["max_symbols_per_request"]
+        self._max_calls_per_minute = config["rate_limiting"]["max_calls_per_minute"]
+        self._max_calls_per_hour = config["rate_limiting"]["max_calls_per_hour"]
+        self._max_calls_per_day = config["rate_limiting"]["max_calls_per_day"]
+        # Set for membership tests; the configured order is kept for error messages
+        self._allowed_intervals = frozenset(config["data_access"]["allowed_intervals"])
+        self._allowed_intervals_text = ', '.join(config["data_access"]["allowed_intervals"])
+        self._max_symbols_in_comparison = config["data_access"]["max_symbols_in_comparison"]
+        
+        self.rate_limiters: OrderedDict[str, RateLimitTracker] = OrderedDict()
+        self.blocked_symbols: FrozenSet[str] = frozenset(
+            symbol.upper() for symbol in self.config["symbol_validation"]["blocked_symbols"]
+        )
+        self.session_data: OrderedDict[str, Dict] = OrderedDict()
+        
+        # Date used in session IDs, re-read at most once a minute
+        self._session_date = str(date.today())
+        self._session_date_checked = time.monotonic()
+        
+        # Periods within the configured history limit
+        max_days = self.config["data_access"]["max_historical_period_days"]
+        self.allowed_periods = frozenset(
+            period for period, days in _PERIOD_DAYS.items() if days <= max_days
+        )
         
         # Compile regex patterns for efficiency
         self._compile_patterns()
         
+        # Tool calls tend to repeat the same symbols within a session
+        self._validate_symbols_cached = lru_cache(maxsize=1024)(self._validate_symbol_tuple)
+        
     def _load_config(self, config_path: Optional[str]) -> Dict:
         """Load configuration from file or use defaults"""
         default_config = {
@@ -122,10 +210,9 @@ class FinancialGuardrails:
         
         if config_path and Path(config_path).exists():
             try:
-                with open(config_path, 'r') as f:
-                    user_config = json.load(f)
-                    # Merge with defaults
-                    self._deep_merge(default_config, user_config)
+                user_config = json_loads(Path(config_path).read_bytes())
+                # Merge with defaults
+                self._deep_merge(default_config, user_config)
             except Exception as e:
                 logger.warning(f"Failed to load config from {config_path}: {e}")
         
@@ -133,35 +220,67 @@ class FinancialGuardrails:
     
     def _deep_merge(self, base: Dict, override: Dict) -> None:
         """Deep merge configuration dictionaries"""
-        for key, value in override.items():
-            if key in base and isinstance(base[key], dict) and isinstance(value, dict):
-                self._deep_merge(base[key], value)
-            else:
-                base[key] = value
+        stack = [(base, override)]
+        while stack:
+            base, override = stack.pop()
+            for key, value in override.items():
+                current = base.get(key)
+                if isinstance(current, dict) and isinstance(value, dict):
+                    stack.append((current, value))
+                else:
+                    base[key] = value
     
     def _compile_patterns(self) -> None:
         """Compile regex patterns for efficient matching"""
-        self.investment_advice_patterns = [
-            re.compile(pattern, re.IGNORECASE) 
-            for pattern in self.config["content_filtering"]["investment_advice_patterns"]
-        ]
+        content_filtering = self.config["content_filtering"]
         
-        self.symbol_pattern = re.compile(
-            self.config["symbol_validation"]["allowed_symbol_pattern"]
+        # One alternation per category so each check is a single regex scan
+        self.investment_advice_re = _compile_alternation(
+            content_filtering["investment_advice_patterns"], escape=False
+        )
+        
+        # Each blocked keyword gets its own group, named kw<n>; the match's lastgroup
+        # maps back to the keyword even when IGNORECASE matched non-ASCII case
+        # variants (e.g. 'İ' or 'ſ') whose .lower() differs from the keyword's
+        blocked_keywords = sorted(content_filtering["blocked_keywords"], key=len, reverse=True)
+        self.blocked_keyword_names = {f'kw{i}': keyword for i, keyword in enumerate(blocked_keywords)}
+        blocked = '|'.join(
+            f'(?P<{name}>{re.escape(keyword)})' for name, keyword in self.blocked_keyword_names.items()
+        ) or '(?!)'
+        
+        # Blocked keywords and high-risk terms share one scan; the lookahead reports
+        # every position where a term starts, so overlapping terms are all found
+        high_risk = _compile_alternation(content_filtering["high_risk_terms"]).pattern
+        self.term_scan_re = re.compile(
+            f'(?={blocked}|(?P<risk>{high_risk}))', re.IGNORECASE
         )
+        self.speculative_re = _compile_alternation(_SPECULATIVE_WORDS)
         
-        # Code injection patterns
-        self.injection_patterns = [
-            re.compile(r'["\'].*["\'].*[;]'),  # SQL injection
-            re.compile(r'<script.*</script>', re.IGNORECASE),  # XSS
-            re.compile(r'(union|select|insert|update|delete|drop)\s+', re.IGNORECASE),
-            re.compile(r'(system|exec|eval|import)\s*\(', re.IGNORECASE),
-            re.compile(r'(__.*__|\.\.\/)', re.IGNORECASE),  # Path traversal
-        ]
+        self.symbol_fullmatch = re.compile(
+            self.config["symbol_validation"]["allowed_symbol_pattern"]
+        ).fullmatch
+        
+        # Code injection patterns, fused into one alternation; the match's
+        # lastgroup names the pattern that fired
+        self.injection_patterns = {
+            'sql': r'["\'].*["\'].*[;]',  # SQL injection
+            'xss': r'<script.*</script>',  # XSS
+            'sql_keyword': r'(union|select|insert|update|delete|drop)\s+',
+            'code_exec': r'(system|exec|eval|import)\s*\(',
+            'path_traversal': r'(__.*__|\.\.\/)',  # Path traversal
+        }
+        self.injection_re = re.compile(
+            '|'.join(f'(?P<{name}>{pattern})' for name, pattern in self.injection_patterns.items()),
+            re.IGNORECASE
+        )
     
     def get_session_id(self, identifier: str = "default") -> str:
         """Generate session ID for tracking"""
-        return hashlib.md5(f"{identifier}_{datetime.now().date()}".encode()).hexdigest()[:16]
+        now = time.monotonic()
+        if now - self._session_date_checked > 60:
+            self._session_date = str(date.today())
+            self._session_date_checked = now
+        return hashlib.blake2b(f"{identifier}_{self._session_date}".encode(), digest_size=8).hexdigest()
     
     def validate_query(self, query: str, session_id: str = "default") -> Tuple[bool, Optional[GuardrailViolation], RiskLevel]:
         """
@@ -174,51 +293,51 @@ class FinancialGuardrails:
             return True, None, RiskLevel.LOW
         
         # Check input length
-        if len(query) > self.config["security"]["max_input_length"]:
+        if len(query) > self._max_input_length:
             violation = GuardrailViolation(
                 violation_type=GuardrailViolationType.EXCESSIVE_REQUEST,
-                message=f"Query too long (max {self.config['security']['max_input_length']} chars)",
+                message=f"Query too long (max {self._max_input_length} chars)",
                 risk_level=RiskLevel.MEDIUM
             )
             return False, violation, RiskLevel.MEDIUM
         
-        query_lower = query.lower()
-        
         # 1. Check for code injection attempts
-        for pattern in self.injection_patterns:
-            if pattern.search(query):
-                violation = GuardrailViolation(
-                    violation_type=GuardrailViolationType.CODE_INJECTION,
-                    message="Potential security threat detected in query",
-                    risk_level=RiskLevel.CRITICAL,
-                    details={"pattern": pattern.pattern}
-                )
-                return False, violation, RiskLevel.CRITICAL
+        match = self.injection_re.search(query)
+        if match:
+            violation = GuardrailViolation(
+                violation_type=GuardrailViolationType.CODE_INJECTION,
+                message="Potential security threat detected in query",
+                risk_level=RiskLevel.CRITICAL,
+                details={"pattern": self.injection_patterns[match.lastgroup]}
+            )
+            return False, violation, RiskLevel.CRITICAL
         
         # 2. Check for investment advice requests
-        for pattern in self.investment_advice_patterns:
-            if pattern.search(query):
-                violation = GuardrailViolation(
-                    violation_type=GuardrailViolationType.INVESTMENT_ADVICE,
-                    message="I cannot provide investment advice. I can only provide factual information about stocks and markets. Please consult a licensed financial advisor for investment decisions.",
-                    risk_level=RiskLevel.HIGH
-                )
-                return False, violation, RiskLevel.HIGH
-        
-        # 3. Check for blocked keywords
-        blocked_keywords = self.config["content_filtering"]["blocked_keywords"]
-        for keyword in blocked_keywords:
-            if keyword.lower() in query_lower:
-                violation = GuardrailViolation(
-                    violation_type=GuardrailViolationType.BLOCKED_CONTENT,
-                    message=f"Query contains blocked content related to: {keyword}",
-                    risk_level=RiskLevel.HIGH,
-                    details={"blocked_keyword": keyword}
-                )
-                return False, violation, RiskLevel.HIGH
+        if self.investment_advice_re.search(query):
+            violation = GuardrailViolation(
+                violation_type=GuardrailViolationType.INVESTMENT_ADVICE,
+                message="I cannot provide investment advice. I can only provide factual information about stocks and markets. Please consult a licensed financial advisor for investment decisions.",
+                risk_level=RiskLevel.HIGH
+            )
+            return False, violation, RiskLevel.HIGH
+        
+        # 3. Check for blocked keywords, collecting high-risk terms in the same pass
+        high_risk_terms = set()
+        for match in self.term_scan_re.finditer(query):
+            if match.lastgroup == 'risk':
+                high_risk_terms.add(match.group('risk').lower())
+                continue
+            keyword = self.blocked_keyword_names[match.lastgroup]
+            violation = GuardrailViolation(
+                violation_type=GuardrailViolationType.BLOCKED_CONTENT,
+                message=f"Query contains blocked content related to: {keyword}",
+                risk_level=RiskLevel.HIGH,
+                details={"blocked_keyword": keyword}
+            )
+            return False, violation, RiskLevel.HIGH
         
         # 4. Assess risk level based on high-risk terms
-        risk_level = self._assess_risk_level(query_lower)
+        risk_level = self._assess_risk_level(query, high_risk_terms)
         if risk_level == RiskLevel.CRITICAL:
             violation = GuardrailViolation(
                 violation_type=GuardrailViolationType.HIGH_RISK_CONTENT,
@@ -239,27 +358,30 @@ class FinancialGuardrails:
         if not symbols:
             return True, None, []
         
-        max_symbols = self.config["symbol_validation"]["max_symbols_per_request"]
+        max_symbols = self._max_symbols_per_request
         if len(symbols) > max_symbols:
             return False, f"Too many symbols. Maximum {max_symbols} allowed.", []
         
+        try:
+            # Normalise in one pass; str.strip rejects any entry that is not a string
+            normalized = list(map(str.upper, map(str.strip, symbols)))
+        except TypeError:
+            non_strings = [str(symbol) for symbol in symbols if not isinstance(symbol, str)]
+            return False, f"Invalid symbols: {', '.join(non_strings)} (not a string)", []
+        
         clean_symbols = []
         invalid_symbols = []
+        symbol_fullmatch = self.symbol_fullmatch
+        blocked_symbols = self.blocked_symbols
         
-        for symbol in symbols:
-            if not symbol or not isinstance(symbol, str):
-                invalid_symbols.append(str(symbol))
-                continue
-                
-            symbol = symbol.strip().upper()
-            
+        for symbol in normalized:
             # Check format
-            if not self.symbol_pattern.match(symbol):
+            if not symbol_fullmatch(symbol):
                 invalid_symbols.append(f"{symbol} (invalid format)")
                 continue
             
             # Check if blocked
-            if symbol in self.blocked_symbols:
+            if symbol in blocked_symbols:
                 invalid_symbols.append(f"{symbol} (blocked)")
                 continue
             
@@ -270,47 +392,66 @@ class FinancialGuardrails:
         
         return True, None, clean_symbols
     
+    def _validate_symbol_tuple(self, symbols: Tuple) -> Tuple[bool, Optional[str]]:
+        """validate_symbols for a hashable tuple, wrapped in an LRU cache at construction"""
+        is_valid, error_msg, _ = self.validate_symbols(list(symbols))
+        return is_valid, error_msg
+    
+    def _check_symbols(self, symbols: Tuple) -> Tuple[bool, Optional[str]]:
+        """validate_symbols for tool arguments, cached when every entry is a string"""
+        # Anything else (e.g. a nested list) is unhashable or invalid anyway
+        if all(isinstance(symbol, str) for symbol in symbols):
+            return self._validate_symbols_cached(symbols)
+        return self._validate_symbol_tuple(symbols)
+    
+    def _get_tracker(self, session_id: str) -> RateLimitTracker:
+        """Get the rate limit tracker for a session, starting with a full bucket"""
+        tracker = self.rate_limiters.get(session_id)
+        if tracker is None:
+            tracker = RateLimitTracker(tokens=float(self._max_calls_per_minute))
+            self.rate_limiters[session_id] = tracker
+            if len(self.rate_limiters) > _MAX_TRACKED_SESSIONS:
+                self.rate_limiters.popitem(last=False)
+        else:
+            self.rate_limiters.move_to_end(session_id)
+        return tracker
+    
     def check_rate_limit(self, session_id: str = "default") -> Tuple[bool, Optional[str]]:
         """Check if request is within rate limits"""
-        if session_id not in self.rate_limiters:
-            self.rate_limiters[session_id] = RateLimitTracker()
+        tracker = self._get_tracker(session_id)
+        now = time.monotonic_ns()
+        capacity = self._max_calls_per_minute
         
-        tracker = self.rate_limiters[session_id]
-        now = datetime.now()
-        config = self.config["rate_limiting"]
+        # Refill the minute bucket for the time elapsed since the last check;
+        # unlike a fixed window this allows no double burst at window edges
+        tracker.tokens = min(capacity, tracker.tokens + (now - tracker.last_refill) * capacity / _MINUTE_NS)
+        tracker.last_refill = now
         
         # Reset counters if needed
-        if (now - tracker.last_reset_minute).total_seconds() >= 60:
-            tracker.calls_per_minute = 0
-            tracker.last_reset_minute = now
-        
-        if (now - tracker.last_reset_hour).total_seconds() >= 3600:
+        if now - tracker.last_reset_hour >= _HOUR_NS:
             tracker.calls_per_hour = 0
             tracker.last_reset_hour = now
         
-        if (now - tracker.last_reset_day).total_seconds() >= 86400:
+        if now - tracker.last_reset_day >= _DAY_NS:
             tracker.calls_per_day = 0
             tracker.last_reset_day = now
         
         # Check limits
-        if tracker.calls_per_minute >= config["max_calls_per_minute"]:
-            return False, f"Rate limit exceeded: {config['max_calls_per_minute']} calls per minute"
+        if tracker.tokens < 1.0:
+            return False, f"Rate limit exceeded: {capacity} calls per minute"
         
-        if tracker.calls_per_hour >= config["max_calls_per_hour"]:
-            return False, f"Rate limit exceeded: {config['max_calls_per_hour']} calls per hour"
+        if tracker.calls_per_hour >= self._max_calls_per_hour:
+            return False, f"Rate limit exceeded: {self._max_calls_per_hour} calls per hour"
         
-        if tracker.calls_per_day >= config["max_calls_per_day"]:
-            return False, f"Rate limit exceeded: {config['max_calls_per_day']} calls per day"
+        if tracker.calls_per_day >= self._max_calls_per_day:
+            return False, f"Rate limit exceeded: {self._max_calls_per_day} calls per day"
         
         return True, None
     
     def record_request(self, session_id: str = "default") -> None:
         """Record a successful request for rate limiting"""
-        if session_id not in self.rate_limiters:
-            self.rate_limiters[session_id] = RateLimitTracker()
-        
-        tracker = self.rate_limiters[session_id]
-        tracker.calls_per_minute += 1
+        tracker = self._get_tracker(session_id)
+        tracker.tokens -= 1.0
         tracker.calls_per_hour += 1
         tracker.calls_per_day += 1
     
@@ -319,12 +460,12 @@ class FinancialGuardrails:
         try:
             # Validate symbols in arguments
             if 'symbol' in tool_args:
-                is_valid, error_msg, _ = self.validate_symbols([tool_args['symbol']])
+                is_valid, error_msg = self._check_symbols((tool_args['symbol'],))
                 if not is_valid:
                     return False, error_msg
             
             if 'symbols' in tool_args:
-                is_valid, error_msg, _ = self.validate_symbols(tool_args['symbols'])
+                is_valid, error_msg = self._check_symbols(tuple(tool_args['symbols']))
                 if not is_valid:
                     return False, error_msg
             
@@ -338,13 +479,12 @@ class FinancialGuardrails:
                     return False, f"Invalid or excessive period: {period}"
                 
                 # Validate interval
-                allowed_intervals = self.config["data_access"]["allowed_intervals"]
-                if interval not in allowed_intervals:
-                    return False, f"Invalid interval. Allowed: {', '.join(allowed_intervals)}"
+                if interval not in self._allowed_intervals:
+                    return False, f"Invalid interval. Allowed: {self._allowed_intervals_text}"
             
             elif tool_name == 'compare_stocks':
                 symbols = tool_args.get('symbols', [])
-                max_compare = self.config["data_access"]["max_symbols_in_comparison"]
+                max_compare = self._max_symbols_in_comparison
                 if len(symbols) > max_compare:
                     return False, f"Too many symbols for comparison. Maximum: {max_compare}"
             
@@ -356,43 +496,41 @@ class FinancialGuardrails:
     
     def sanitize_input(self, input_str: str) -> str:
         """Sanitize user input"""
-        if not self.config["security"]["sanitize_inputs"]:
+        if not self._sanitize_inputs:
             return input_str
         
-        # Remove dangerous characters
-        sanitized = re.sub(r'[<>"\';\\]', '', input_str)
-        
-        # Limit length
-        max_length = self.config["security"]["max_input_length"]
-        if len(sanitized) > max_length:
-            sanitized = sanitized[:max_length]
-        
-        return sanitized.strip()
+        # Remove dangerous characters and limit length
+        return input_str.translate(_SANITIZE_TABLE)[:self._max_input_length].strip()
     
     def add_disclaimer(self, response: str, risk_level: RiskLevel) -> str:
         """Add appropriate disclaimers based on risk level"""
-        if not self.config["response_filtering"]["add_disclaimers"]:
-            return response
-        
-        disclaimers = {
-            RiskLevel.LOW: "\n\n📋 Note: This information is for educational purposes only and should not be considered as investment advice.",
-            RiskLevel.MEDIUM: "\n\n⚠️ Disclaimer: This data is for informational purposes only and not investment advice. Market conditions can change rapidly. Please consult a financial advisor.",
-            RiskLevel.HIGH: "\n\n🚨 Important: This involves high-risk financial concepts. Please consult a licensed financial advisor before making any investment decisions. Past performance does not guarantee future results.",
-            RiskLevel.CRITICAL: "\n\n🛑 Critical Warning: This involves extremely high-risk financial instruments that can result in significant losses. Seek professional advice and understand all risks before proceeding. Only invest what you can afford to lose."
-        }
+        return response + self.get_disclaimer(risk_level)
+    
+    def get_disclaimer(self, risk_level: RiskLevel) -> str:
+        """Get the disclaimer for a risk level (empty when disclaimers are disabled)"""
+        if not self._add_disclaimers:
+            return ""
         
-        return response + disclaimers.get(risk_level, disclaimers[RiskLevel.LOW])
+        return self._DISCLAIMERS.get(risk_level, self._DISCLAIMERS[RiskLevel.LOW])
     
     def log_violation(self, violation: GuardrailViolation, session_id: str = "default") -> None:
         """Log security violations"""
-        if self.config["security"]["log_violations"]:
+        if self._log_violations:
             logger.warning(f"Guardrail violation [{session_id}]: {violation.violation_type.value} - {violation.message}")
+        
+        if violation.timestamp is None:
+            violation.timestamp = datetime.now()
             
         # Store in session data for monitoring
-        if session_id not in self.session_data:
-            self.session_data[session_id] = {"violations": []}
+        session = self.session_data.get(session_id)
+        if session is None:
+            session = self.session_data[session_id] = {"violations": []}
+            if len(self.session_data) > _MAX_TRACKED_SESSIONS:
+                self.session_data.popitem(last=False)
+        else:
+            self.session_data.move_to_end(session_id)
         
-        self.session_data[session_id]["violations"].append({
+        session["violations"].append({
             "type": violation.violation_type.value,
             "message": violation.message,
             "risk_level": violation.risk_level.value,
@@ -412,7 +550,7 @@ class FinancialGuardrails:
         if session_id in self.rate_limiters:
             tracker = self.rate_limiters[session_id]
             stats["rate_limits"] = {
-                "calls_per_minute": tracker.calls_per_minute,
+                "minute_tokens_remaining": int(tracker.tokens),
                 "calls_per_hour": tracker.calls_per_hour,
                 "calls_per_day": tracker.calls_per_day
             }
@@ -423,10 +561,9 @@ class FinancialGuardrails:
         
         return stats
     
-    def _assess_risk_level(self, query: str) -> RiskLevel:
-        """Assess the risk level of a query"""
-        high_risk_terms = self.config["content_filtering"]["high_risk_terms"]
-        high_risk_count = sum(1 for term in high_risk_terms if term.lower() in query)
+    def _assess_risk_level(self, query: str, high_risk_terms: Set[str]) -> RiskLevel:
+        """Assess the risk level of a query from the high-risk terms found in it"""
+        high_risk_count = len(high_risk_terms)
         
         if high_risk_count >= 3:
             return RiskLevel.CRITICAL
@@ -434,23 +571,15 @@ class FinancialGuardrails:
             return RiskLevel.HIGH
         elif high_risk_count == 1:
             return RiskLevel.MEDIUM
-        elif any(word in query for word in ['volatile', 'risky', 'speculation', 'gamble']):
+        elif self.speculative_re.search(query):
             return RiskLevel.MEDIUM
         else:
             return RiskLevel.LOW
     
     def _is_valid_period(self, period: str) -> bool:
         """Check if historical data period is reasonable"""
-        max_days = self.config["data_access"]["max_historical_period_days"]
-        
-        # Convert period to days
-        period_map = {
-            '1d': 1, '5d': 5, '1mo': 30, '3mo': 90, '6mo': 180,
-            '1y': 365, '2y': 730, '5y': 1825, '10y': 3650, 'max': 7300
-        }
-        
-        days = period_map.get(period.lower(), 0)
-        return 0 < days <= max_days
+        # Periods are normally lowercase already; only fold case on a miss
+        return period in self.allowed_periods or period.lower() in self.allowed_periods
 
 # Convenience functions for easy import
 def create_guardrails(config_path: Optional[str] = None) -> FinancialGuardrails:
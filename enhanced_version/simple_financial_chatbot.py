@@ -1,15 +1,24 @@
 from dotenv import load_dotenv
-from anthropic import Anthropic
+from anthropic import AsyncAnthropic
 from mcp import ClientSession, StdioServerParameters, types
 from mcp.client.stdio import stdio_client
-from typing import List, Dict, TypedDict
+from typing import List, Dict, Optional, Set, Tuple
 from contextlib import AsyncExitStack
-import json
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+import anyio
 import asyncio
+import os
 import re
 import logging
+import sys
 import time
-from datetime import datetime, timedelta
+
+try:
+    from orjson import loads as json_loads
+except ImportError:  # orjson is an optional speedup
+    from json import loads as json_loads
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -17,47 +26,126 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
+# Splits "/prompt" arguments into name and key=value / key="quoted value" parts
+_PROMPT_RE = re.compile(r'(\w+(?:=(?:"[^"]*"|[^\s]+))?)')
+
+# Most tool calls in flight at once on one server's stdio pipe
+_MAX_CALLS_PER_SESSION = 4
+
+# Resource reads are served from memory for this long (cleared by /refresh)
+_RESOURCE_TTL_SECONDS = 60
+_RESOURCE_CACHE_SIZE = 128
+
+# Raised by a session whose server process has gone away
+_CONNECTION_ERRORS = (anyio.ClosedResourceError, anyio.BrokenResourceError, ConnectionError)
+
+# System prompt sent with every request
+_SYSTEM_PROMPT = """You are a financial data assistant. IMPORTANT GUIDELINES:
+- Provide only factual, objective financial data
+- NEVER give investment advice or recommendations
+- Always include disclaimers about data being for informational purposes only
+- If asked for advice, redirect to consulting licensed financial professionals
+- Focus on data analysis, not predictions or recommendations"""
+
+_RULE = "=" * 50
+
+# Printed once when the chat loop starts
+_BANNER = f"""
+💰 Financial MCP Chatbot Started!
+{_RULE}
+🛡️ BASIC GUARDRAILS ENABLED:
+• Simple rate limiting (1 second between requests)
+• Investment advice detection and blocking
+• Automatic disclaimers added to responses
+{_RULE}
+Available commands:
+📊 Regular queries: Ask about stocks, markets, analysis
+📁 Resources: @portfolios, @<filename>
+📝 Prompts: /prompts, /prompt <name> <args>
+🔄 Refresh cached resources: /refresh
+❌ Exit: type 'quit'
+{_RULE}"""
+
+@lru_cache(maxsize=1)
+def _load_server_config(path: str) -> dict:
+    """Read and parse the MCP server configuration, once per path."""
+    return json_loads(Path(path).read_bytes())
+
+# Bytes read from stdin beyond the last line handed out by _read_input
+_stdin_pending = bytearray()
+
+async def _read_input(prompt: str) -> str:
+    """Read one line of chat input; waits on the event loop rather than in a thread."""
+    if sys.platform == "win32":
+        # The Windows event loop cannot watch stdin
+        return await asyncio.to_thread(input, prompt)
+    
+    print(prompt, end="", flush=True)
+    loop = asyncio.get_running_loop()
+    fd = sys.stdin.fileno()
+    while b"\n" not in _stdin_pending:
+        ready = loop.create_future()
+        loop.add_reader(fd, lambda: ready.done() or ready.set_result(None))
+        try:
+            await ready
+        finally:
+            loop.remove_reader(fd)
+        chunk = os.read(fd, 4096)
+        if not chunk:
+            if not _stdin_pending:
+                raise EOFError
+            chunk = b"\n"
+        _stdin_pending.extend(chunk)
+    line, _, rest = _stdin_pending.partition(b"\n")
+    _stdin_pending[:] = rest
+    return line.decode(sys.stdin.encoding or "utf-8", errors="replace").rstrip("\r")
+
 class SimpleGuardrails:
     """Simple guardrails that don't break functionality"""
     
+    DISCLAIMER = "\n\n📋 Disclaimer: This information is for educational purposes only and not investment advice."
+    
     def __init__(self):
-        self.request_count = 0
-        self.last_request_time = None
+        # time.monotonic() of the last recorded request
+        self.last_request_time = float('-inf')
         self.investment_advice_keywords = [
             'should i buy', 'should i sell', 'recommend buying', 'recommend selling',
             'investment advice', 'what should i invest', 'trading advice'
         ]
+        # All keywords in one case-insensitive alternation: a single scan per query
+        self.investment_advice_re = re.compile(
+            '|'.join(re.escape(keyword) for keyword in self.investment_advice_keywords),
+            re.IGNORECASE
+        )
     
     def check_rate_limit(self) -> tuple[bool, str]:
         """Simple rate limiting - max 1 request per second"""
-        now = datetime.now()
-        if self.last_request_time:
-            time_diff = (now - self.last_request_time).total_seconds()
-            if time_diff < 1.0:
-                return False, "Please wait 1 second between requests"
+        if time.monotonic() - self.last_request_time < 1.0:
+            return False, "Please wait 1 second between requests"
         return True, ""
     
     def validate_query(self, query: str) -> tuple[bool, str]:
         """Basic query validation"""
-        query_lower = query.lower()
-        
         # Check for investment advice
-        for keyword in self.investment_advice_keywords:
-            if keyword in query_lower:
-                return False, "⚠️ I cannot provide investment advice. I can only provide factual information about stocks and markets. Please consult a licensed financial advisor for investment decisions."
+        if self.investment_advice_re.search(query):
+            return False, "⚠️ I cannot provide investment advice. I can only provide factual information about stocks and markets. Please consult a licensed financial advisor for investment decisions."
         
         return True, ""
     
     def record_request(self):
         """Record request"""
-        self.request_count += 1
-        self.last_request_time = datetime.now()
+        self.last_request_time = time.monotonic()
     
     def add_disclaimer(self, response: str) -> str:
         """Add simple disclaimer"""
-        return response + "\n\n📋 Disclaimer: This information is for educational purposes only and not investment advice."
+        return f"{response}{self.DISCLAIMER}"
+    
+    def get_disclaimer(self) -> str:
+        """Get the disclaimer text on its own (for responses that were streamed)"""
+        return self.DISCLAIMER
 
-class ToolDefinition(TypedDict):
+@dataclass(slots=True)
+class ToolDefinition:
     name: str
     description: str
     input_schema: dict
@@ -71,11 +159,26 @@ class FinancialChatBot:
         # Initialize session and client objects
         self.sessions: List[ClientSession] = []
         self.exit_stack = AsyncExitStack()
-        self.anthropic = Anthropic()
+        self.anthropic = AsyncAnthropic()
         self.available_tools: List[ToolDefinition] = []
+        # Frozen copy of available_tools sent to Claude, built once all servers are connected
+        self._tools_payload: Tuple[dict, ...] = ()
         self.tool_to_session: Dict[str, ClientSession] = {}
+        self.resource_to_session: Dict[str, ClientSession] = {}
+        self.resource_templates: List[Tuple[re.Pattern, ClientSession]] = []
+        self.prompt_to_session: Dict[str, ClientSession] = {}
+        self.session_limits: Dict[ClientSession, asyncio.Semaphore] = {}
+        # Server name and config behind each session, for reconnecting
+        self.session_servers: Dict[ClientSession, Tuple[str, dict]] = {}
+        # Sessions whose server went away; replaced before the next query
+        self._failed_sessions: Set[ClientSession] = set()
         self.available_resources: List[str] = []
+        # Resource URI -> (time.monotonic() expiry, content)
+        self._resource_cache: Dict[str, Tuple[float, str]] = {}
         self.available_prompts: List[str] = []
+        # Rendered /prompts and tool listings, built once all servers are connected
+        self._prompts_listing = "No prompts available."
+        self._tools_listing = ""
         
         # Initialize simple guardrails
         self.guardrails = SimpleGuardrails()
@@ -83,120 +186,265 @@ class FinancialChatBot:
     async def connect_to_server(self, server_name: str, server_config: dict) -> None:
         """Connect to a single MCP server."""
         try:
-            server_params = StdioServerParameters(**server_config)
-            stdio_transport = await self.exit_stack.enter_async_context(
-                stdio_client(server_params)
-            )
-            read, write = stdio_transport
-            session = await self.exit_stack.enter_async_context(
-                ClientSession(read, write)
-            )
-            await session.initialize()
-            self.sessions.append(session)
-            
-            # List available tools for this session
-            response = await session.list_tools()
-            tools = response.tools
-            print(f"\nConnected to {server_name} with tools:", [t.name for t in tools])
-            
-            for tool in tools:
-                self.tool_to_session[tool.name] = session
-                self.available_tools.append({
-                    "name": tool.name,
-                    "description": tool.description,
-                    "input_schema": tool.inputSchema
-                })
-            
-            # List available resources
-            try:
-                resources_response = await session.list_resources()
-                resources = resources_response.resources
-                for resource in resources:
-                    self.available_resources.append(resource.uri)
-                print(f"Available resources from {server_name}:", [r.uri for r in resources])
-            except Exception as e:
-                logger.info(f"No resources available from {server_name}: {e}")
-            
-            # List available prompts
-            try:
-                prompts_response = await session.list_prompts()
-                prompts = prompts_response.prompts
-                for prompt in prompts:
-                    self.available_prompts.append(prompt.name)
-                print(f"Available prompts from {server_name}:", [p.name for p in prompts])
-            except Exception as e:
-                logger.info(f"No prompts available from {server_name}: {e}")
-                
+            session = await self._open_session(server_config)
+            await self._register_session(server_name, server_config, session)
         except Exception as e:
             print(f"Failed to connect to {server_name}: {e}")
             logger.error(f"Connection error for {server_name}: {e}")
 
+    async def _open_session(self, server_config: dict) -> ClientSession:
+        """
+        Start a server process and open its client session.
+        Must run in the task that later closes exit_stack: the stdio transport
+        cannot be closed from a different task than the one that opened it.
+        """
+        server_params = StdioServerParameters(**server_config)
+        read, write = await self.exit_stack.enter_async_context(
+            stdio_client(server_params)
+        )
+        return await self.exit_stack.enter_async_context(
+            ClientSession(read, write)
+        )
+
+    async def _register_session(self, server_name: str, server_config: dict, session: ClientSession) -> None:
+        """Initialize a session and register its tools, resources and prompts."""
+        await session.initialize()
+        self.sessions.append(session)
+        self.session_limits[session] = asyncio.Semaphore(_MAX_CALLS_PER_SESSION)
+        self.session_servers[session] = (server_name, server_config)
+        
+        # Discover tools, resources, templates and prompts in one round trip;
+        # servers without resources/prompts answer those requests with errors
+        (tools_response, resources_response,
+         templates_response, prompts_response) = await asyncio.gather(
+            session.list_tools(),
+            session.list_resources(),
+            session.list_resource_templates(),
+            session.list_prompts(),
+            return_exceptions=True
+        )
+        
+        # Tools are required; failing to list them fails the connection
+        if isinstance(tools_response, BaseException):
+            raise tools_response
+        tools = tools_response.tools
+        # Summary lines are written in one go once this server is registered
+        lines = [f"\nConnected to {server_name} with tools: {[t.name for t in tools]}"]
+        
+        for tool in tools:
+            self.tool_to_session[tool.name] = session
+            self.available_tools.append(
+                ToolDefinition(tool.name, tool.description, tool.inputSchema)
+            )
+        
+        # Register available resources
+        if isinstance(resources_response, BaseException):
+            logger.info(f"No resources available from {server_name}: {resources_response}")
+        else:
+            resources = resources_response.resources
+            for resource in resources:
+                self.resource_to_session[str(resource.uri)] = session
+                self.available_resources.append(resource.uri)
+            lines.append(f"Available resources from {server_name}: {[r.uri for r in resources]}")
+        
+        # Register resource templates (e.g. finance://{filename})
+        if isinstance(templates_response, BaseException):
+            logger.info(f"No resource templates available from {server_name}: {templates_response}")
+        else:
+            for template in templates_response.resourceTemplates:
+                self.resource_templates.append(
+                    (self._compile_uri_template(template.uriTemplate), session)
+                )
+        
+        # Register available prompts
+        if isinstance(prompts_response, BaseException):
+            logger.info(f"No prompts available from {server_name}: {prompts_response}")
+        else:
+            prompts = prompts_response.prompts
+            for prompt in prompts:
+                self.prompt_to_session[prompt.name] = session
+                self.available_prompts.append(prompt.name)
+            lines.append(f"Available prompts from {server_name}: {[p.name for p in prompts]}")
+        
+        print("\n".join(lines))
+
     async def connect_to_servers(self):
         """Connect to all configured MCP servers."""
         try:
-            with open("server_config.json", "r") as file:
-                data = json.load(file)
+            data = await asyncio.to_thread(_load_server_config, "server_config.json")
             
             servers = data.get("mcpServers", {})
             
+            # Start the server processes from this task (see _open_session);
+            # spawning is quick, the handshakes below are the slow part
+            opened = []
             for server_name, server_config in servers.items():
-                await self.connect_to_server(server_name, server_config)
+                try:
+                    opened.append((server_name, server_config, await self._open_session(server_config)))
+                except Exception as e:
+                    print(f"Failed to connect to {server_name}: {e}")
+                    logger.error(f"Connection error for {server_name}: {e}")
+            
+            # Handshake and discover concurrently; registration has no awaits
+            # between mutations, so the shared lists stay consistent
+            results = await asyncio.gather(
+                *(self._register_session(*entry) for entry in opened),
+                return_exceptions=True
+            )
+            for (server_name, _, _), result in zip(opened, results):
+                if isinstance(result, BaseException):
+                    print(f"Failed to connect to {server_name}: {result}")
+                    logger.error(f"Connection error for {server_name}: {result}")
+            
+            self._refresh_listings()
         except Exception as e:
             print(f"Error loading server configuration: {e}")
             logger.error(f"Server configuration error: {e}")
             raise
 
+    def _refresh_listings(self) -> None:
+        """Rebuild the tool payload and listings after sessions were (re)registered."""
+        # Servers finish in any order; keep the tool listing stable
+        self.available_tools.sort(key=lambda tool: tool.name)
+        self._tools_payload = tuple(
+            {"name": tool.name, "description": tool.description, "input_schema": tool.input_schema}
+            for tool in self.available_tools
+        )
+        self._prompts_listing = self._render_prompts_listing()
+        self._tools_listing = self._render_tools_listing()
+
+    def _server_unavailable(self, session: ClientSession) -> str:
+        """Mark a session whose server went away for reconnection and describe it."""
+        self._failed_sessions.add(session)
+        server_name = self.session_servers[session][0]
+        return f"server {server_name} is unavailable; reconnecting before the next query"
+
+    def _unregister_session(self, session: ClientSession) -> Tuple[str, dict]:
+        """Drop everything registered for a session, returning its server name and config."""
+        self.sessions.remove(session)
+        del self.session_limits[session]
+        
+        tool_names = {name for name, owner in self.tool_to_session.items() if owner is session}
+        uris = {uri for uri, owner in self.resource_to_session.items() if owner is session}
+        prompt_names = {name for name, owner in self.prompt_to_session.items() if owner is session}
+        for name in tool_names:
+            del self.tool_to_session[name]
+        for uri in uris:
+            del self.resource_to_session[uri]
+        for name in prompt_names:
+            del self.prompt_to_session[name]
+        
+        self.available_tools = [tool for tool in self.available_tools if tool.name not in tool_names]
+        self.available_resources = [uri for uri in self.available_resources if str(uri) not in uris]
+        self.available_prompts = [name for name in self.available_prompts if name not in prompt_names]
+        self.resource_templates = [
+            (pattern, owner) for pattern, owner in self.resource_templates if owner is not session
+        ]
+        return self.session_servers.pop(session)
+
+    async def _reconnect_failed_servers(self) -> None:
+        """
+        Replace sessions whose server went away with fresh connections.
+        Runs from chat_loop, the task that owns exit_stack; the dead transports
+        stay on the stack until cleanup.
+        """
+        failed, self._failed_sessions = self._failed_sessions, set()
+        for session in failed:
+            server_name, server_config = self._unregister_session(session)
+            print(f"🔄 Reconnecting to {server_name}...")
+            await self.connect_to_server(server_name, server_config)
+        self._refresh_listings()
+
     async def get_resource(self, resource_uri: str) -> str:
         """Get content from a resource."""
+        cached = self._resource_cache.get(resource_uri)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+        
         try:
-            # Find the session that provides this resource
-            for session in self.sessions:
-                try:
-                    result = await session.read_resource(resource_uri)
-                    return result.contents[0].text if result.contents else "No content available"
-                except Exception:
-                    continue
-            return f"Resource not found: {resource_uri}"
+            session = self._find_resource_session(resource_uri)
+            if session is None:
+                return f"Resource not found: {resource_uri}"
+            
+            result = await session.read_resource(resource_uri)
+            content = result.contents[0].text if result.contents else "No content available"
+            
+            # Cache successful reads only, dropping the oldest entry once full
+            if resource_uri not in self._resource_cache and len(self._resource_cache) >= _RESOURCE_CACHE_SIZE:
+                del self._resource_cache[next(iter(self._resource_cache))]
+            self._resource_cache[resource_uri] = (time.monotonic() + _RESOURCE_TTL_SECONDS, content)
+            return content
+        except _CONNECTION_ERRORS:
+            return f"Error retrieving resource: {self._server_unavailable(session)}"
         except Exception as e:
             return f"Error retrieving resource: {str(e)}"
 
+    @staticmethod
+    def _compile_uri_template(uri_template: str) -> re.Pattern:
+        """Turn an RFC 6570 style template like finance://{filename} into a regex."""
+        return re.compile(re.sub(r'\\\{\w+\\\}', r'[^/]+', re.escape(uri_template)) + '$')
+
+    def _find_resource_session(self, resource_uri: str) -> Optional[ClientSession]:
+        """Look up the session that serves a resource URI."""
+        session = self.resource_to_session.get(resource_uri)
+        if session is not None:
+            return session
+        for pattern, template_session in self.resource_templates:
+            if pattern.match(resource_uri):
+                return template_session
+        return None
+
     async def execute_prompt(self, prompt_name: str, arguments: Dict[str, str]) -> str:
         """Execute a prompt template with given arguments."""
         try:
-            # Find the session that provides this prompt
-            for session in self.sessions:
-                try:
-                    result = await session.get_prompt(prompt_name, arguments)
-                    if result.messages:
-                        # Extract the prompt content and send to LLM
-                        prompt_content = ""
-                        for message in result.messages:
-                            if hasattr(message, 'content'):
-                                if hasattr(message.content, 'text'):
-                                    prompt_content += message.content.text
-                                else:
-                                    prompt_content += str(message.content)
-                        
-                        # Process the prompt with the LLM
-                        await self.process_query(prompt_content)
-                        return ""
-                    return "No prompt content received"
-                except Exception:
-                    continue
-            return f"Prompt not found: {prompt_name}"
+            session = self.prompt_to_session.get(prompt_name)
+            if session is None:
+                return f"Prompt not found: {prompt_name}"
+            
+            result = await session.get_prompt(prompt_name, arguments)
+            if result.messages:
+                # Extract the prompt content and send to LLM
+                prompt_content = ""
+                for message in result.messages:
+                    if hasattr(message, 'content'):
+                        if hasattr(message.content, 'text'):
+                            prompt_content += message.content.text
+                        else:
+                            prompt_content += str(message.content)
+                
+                # Process the prompt with the LLM
+                await self.process_query(prompt_content)
+                return ""
+            return "No prompt content received"
+        except _CONNECTION_ERRORS:
+            return f"Error executing prompt: {self._server_unavailable(session)}"
         except Exception as e:
             return f"Error executing prompt: {str(e)}"
 
     def list_prompts(self) -> str:
         """List all available prompts."""
+        return self._prompts_listing
+
+    def _render_prompts_listing(self) -> str:
+        """Render the /prompts listing from the connected servers' prompts."""
         if not self.available_prompts:
             return "No prompts available."
         
-        content = "Available prompts:\n"
-        for prompt in self.available_prompts:
-            content += f"- {prompt}\n"
-        content += "\nUsage: /prompt <name> <arg1=value1> <arg2=value2>"
-        return content
+        parts = ["Available prompts:"]
+        parts.extend(f"- {prompt}" for prompt in self.available_prompts)
+        parts.append("\nUsage: /prompt <name> <arg1=value1> <arg2=value2>")
+        return "\n".join(parts)
+
+    def _render_tools_listing(self) -> str:
+        """Render the tool overview shown when the chat starts."""
+        if not self.available_tools:
+            return ""
+        
+        parts = ["\n🔧 Available tools:"]
+        parts.extend(
+            f"  - {tool.name}: {tool.description[:80]}..." for tool in self.available_tools
+        )
+        return "\n".join(parts)
 
     def parse_prompt_command(self, user_input: str) -> tuple:
         """Parse prompt command from user input."""
@@ -204,7 +452,7 @@ class FinancialChatBot:
         command = user_input[7:].strip()  # Remove '/prompt '
         
         # Split by spaces but handle quoted arguments
-        parts = re.findall(r'(\w+(?:=(?:"[^"]*"|[^\s]+))?)', command)
+        parts = _PROMPT_RE.findall(command)
         
         if not parts:
             return None, {}
@@ -242,117 +490,94 @@ class FinancialChatBot:
             
             messages = [{'role':'user', 'content':query}]
             
-            # 4. Enhanced system prompt
-            system_prompt = """You are a financial data assistant. IMPORTANT GUIDELINES:
-            - Provide only factual, objective financial data
-            - NEVER give investment advice or recommendations
-            - Always include disclaimers about data being for informational purposes only
-            - If asked for advice, redirect to consulting licensed financial professionals
-            - Focus on data analysis, not predictions or recommendations"""
+            response = await self._stream_message(messages)
             
-            response = self.anthropic.messages.create(
-                max_tokens = 4096,
-                model = 'claude-3-5-sonnet-20241022', 
-                system = system_prompt,
-                tools = self.available_tools,
-                messages = messages
-            )
-            
-            process_query = True
-            while process_query:
-                assistant_content = []
-                for content in response.content:
-                    if content.type =='text':
-                        # Add simple disclaimer
-                        final_response = self.guardrails.add_disclaimer(content.text)
-                        print(final_response)
-                        assistant_content.append(content)
-                        if(len(response.content) == 1):
-                            process_query= False
-                    elif content.type == 'tool_use':
-                        assistant_content.append(content)
-                        messages.append({'role':'assistant', 'content':assistant_content})
-                        tool_id = content.id
-                        tool_args = content.input
-                        tool_name = content.name
-
-                        print(f"\n🔧 Calling tool {tool_name} with args {tool_args}")
-                        
-                        # Call tool WITHOUT modifying arguments (this was the problem!)
-                        try:
-                            session = self.tool_to_session[tool_name]
-                            result = await session.call_tool(tool_name, arguments=tool_args)
-                            print(f"✅ Tool result received")
-                            
-                            messages.append({"role": "user", 
-                                              "content": [
-                                                  {
-                                                      "type": "tool_result",
-                                                      "tool_use_id":tool_id,
-                                                      "content": result.content
-                                                  }
-                                              ]
-                                            })
-                        except Exception as e:
-                            error_msg = f"Error calling tool {tool_name}: {str(e)}"
-                            print(f"❌ {error_msg}")
-                            messages.append({"role": "user", 
-                                              "content": [
-                                                  {
-                                                      "type": "tool_result",
-                                                      "tool_use_id":tool_id,
-                                                      "content": error_msg
-                                                  }
-                                              ]
-                                            })
-                        
-                        response = self.anthropic.messages.create(
-                            max_tokens = 4096,
-                            model = 'claude-3-5-sonnet-20241022',
-                            system = system_prompt,
-                            tools = self.available_tools,
-                            messages = messages
-                        ) 
-                        
-                        if(len(response.content) == 1 and response.content[0].type == "text"):
-                            final_response = self.guardrails.add_disclaimer(response.content[0].text)
-                            print(final_response)
-                            process_query= False
+            while True:
+                tool_uses = [content for content in response.content if content.type == 'tool_use']
+                if any(content.type == 'text' for content in response.content):
+                    # Text was printed while streaming; close it with one disclaimer
+                    print(self.guardrails.get_disclaimer())
+                
+                if not tool_uses:
+                    break
+                
+                # Answer every tool_use of this turn in a single user message,
+                # running the tools concurrently
+                messages.append({'role':'assistant', 'content':list(response.content)})
+                tool_results = await asyncio.gather(
+                    *(self._invoke_tool(content) for content in tool_uses)
+                )
+                messages.append({'role':'user', 'content':list(tool_results)})
+                # Tools save their results as resources, so cached reads may be stale
+                self._resource_cache.clear()
+                
+                response = await self._stream_message(messages)
                             
         except Exception as e:
             print(f"❌ Error processing query: {str(e)}")
             logger.error(f"Query processing error: {e}")
 
+    async def _invoke_tool(self, content) -> dict:
+        """Run a single tool_use block, returning its tool_result block."""
+        tool_name = content.name
+        tool_args = content.input
+        print(f"\n🔧 Calling tool {tool_name} with args {tool_args}")
+        
+        # Call tool WITHOUT modifying arguments (this was the problem!)
+        try:
+            session = self.tool_to_session[tool_name]
+            # Cap concurrent calls per server so one busy server cannot hog the fan-out
+            async with self.session_limits[session]:
+                result = await session.call_tool(tool_name, arguments=tool_args)
+            print(f"✅ Tool result received")
+            tool_content = result.content
+        except _CONNECTION_ERRORS:
+            tool_content = f"Error calling tool {tool_name}: {self._server_unavailable(session)}"
+            print(f"❌ {tool_content}")
+        except Exception as e:
+            tool_content = f"Error calling tool {tool_name}: {str(e)}"
+            print(f"❌ {tool_content}")
+        
+        return {
+            "type": "tool_result",
+            "tool_use_id": content.id,
+            "content": tool_content
+        }
+
+    async def _stream_message(self, messages: list):
+        """Stream a Claude response to stdout as it arrives and return the final message."""
+        async with self.anthropic.messages.stream(
+            max_tokens = 4096,
+            model = 'claude-3-5-sonnet-20241022',
+            system = _SYSTEM_PROMPT,
+            tools = self._tools_payload,
+            messages = messages
+        ) as stream:
+            async for text in stream.text_stream:
+                print(text, end="", flush=True)
+            return await stream.get_final_message()
+
     async def chat_loop(self):
         """Run an interactive chat loop with basic safety features."""
-        print("\n💰 Financial MCP Chatbot Started!")
-        print("=" * 50)
-        print("🛡️ BASIC GUARDRAILS ENABLED:")
-        print("• Simple rate limiting (1 second between requests)")
-        print("• Investment advice detection and blocking")
-        print("• Automatic disclaimers added to responses")
-        print("=" * 50)
-        print("Available commands:")
-        print("📊 Regular queries: Ask about stocks, markets, analysis")
-        print("📁 Resources: @portfolios, @<filename>")
-        print("📝 Prompts: /prompts, /prompt <name> <args>")
-        print("❌ Exit: type 'quit'")
-        print("=" * 50)
+        print(_BANNER)
         
         # Show available tools
-        if self.available_tools:
-            print("\n🔧 Available tools:")
-            for tool in self.available_tools:
-                print(f"  - {tool['name']}: {tool['description'][:80]}...")
+        if self._tools_listing:
+            print(self._tools_listing)
         
         while True:
             try:
-                query = input("\n💭 Query: ").strip()
+                # Read input off the event loop so MCP sessions keep being served
+                query = (await _read_input("\n💭 Query: ")).strip()
         
                 if query.lower() == 'quit':
                     print("👋 Goodbye!")
                     break
                 
+                # Bring back any server that went away during the last query
+                if self._failed_sessions:
+                    await self._reconnect_failed_servers()
+                
                 # Handle resource requests (@)
                 if query.startswith('@'):
                     resource_name = query[1:]
@@ -363,6 +588,11 @@ class FinancialChatBot:
                     print(result)
                     continue
                 
+                if query == '/refresh':
+                    self._resource_cache.clear()
+                    print("🔄 Resource cache cleared")
+                    continue
+                
                 # Handle prompt commands (/)
                 if query.startswith('/prompts'):
                     print(self.list_prompts())
@@ -379,9 +609,6 @@ class FinancialChatBot:
                 # Regular query processing
                 await self.process_query(query)
                         
-            except KeyboardInterrupt:
-                print("\n👋 Goodbye!")
-                break
             except Exception as e:
                 print(f"\n❌ Error: {str(e)}")
                 logger.error(f"Chat loop error: {e}")
@@ -405,4 +632,8 @@ async def main():
         await chatbot.cleanup()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        # Ctrl-C: main() has already cleaned up on the way out
+        print("\n👋 Goodbye!")
@@ -1,13 +1,19 @@
 from dotenv import load_dotenv
-from anthropic import Anthropic
+from anthropic import AsyncAnthropic
 from mcp import ClientSession, StdioServerParameters, types
 from mcp.client.stdio import stdio_client
-from typing import List, Dict, TypedDict
+from typing import List, Dict, Optional, TextIO, Tuple, TypedDict
 from contextlib import AsyncExitStack
 import json
 import asyncio
+import inspect
+import io
+import os
 import re
 import logging
+import sys
+import time
+import uuid
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -15,6 +21,58 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
+# Splits "/prompt" arguments into name and key=value / key="quoted value" parts
+_PROMPT_RE = re.compile(r'(\w+(?:=(?:"[^"]*"|[^\s]+))?)')
+
+# Streamed text is flushed to the terminal at most this often (seconds)
+_FLUSH_INTERVAL = 0.04
+
+# Anthropic prompt-caching marker for the static tool schema
+_CACHE_CONTROL = {"type": "ephemeral"}
+
+_RULE = "=" * 50
+
+# Printed once when the chat loop starts
+_BANNER = f"""
+💰 Financial MCP Chatbot Started!
+{_RULE}
+Available commands:
+📊 Regular queries: Ask about stocks, markets, analysis
+📁 Resources: @portfolios, @<filename>
+📝 Prompts: /prompts, /prompt <name> <args>
+⏳ Background prompts: /prompt <name> <args> &, /jobs, /result <id>
+❌ Exit: type 'quit'
+{_RULE}"""
+
+# Bytes read from stdin beyond the last line handed out by _read_input
+_stdin_pending = bytearray()
+
+async def _read_input(prompt: str) -> str:
+    """Like input(), but awaits stdin on the event loop so Ctrl-C never waits on a thread."""
+    if sys.platform == "win32":
+        # The Windows event loop cannot watch stdin
+        return await asyncio.to_thread(input, prompt)
+    
+    print(prompt, end="", flush=True)
+    loop = asyncio.get_running_loop()
+    fd = sys.stdin.fileno()
+    while b"\n" not in _stdin_pending:
+        ready = loop.create_future()
+        loop.add_reader(fd, lambda: ready.done() or ready.set_result(None))
+        try:
+            await ready
+        finally:
+            loop.remove_reader(fd)
+        chunk = os.read(fd, 4096)
+        if not chunk:
+            if not _stdin_pending:
+                raise EOFError
+            chunk = b"\n"
+        _stdin_pending.extend(chunk)
+    line, _, rest = _stdin_pending.partition(b"\n")
+    _stdin_pending[:] = rest
+    return line.decode(sys.stdin.encoding or "utf-8", errors="replace").rstrip("\r")
+
 class ToolDefinition(TypedDict):
     name: str
     description: str
@@ -29,11 +87,32 @@ class FinancialChatBot:
         # Initialize session and client objects
         self.sessions: List[ClientSession] = []
         self.exit_stack = AsyncExitStack()
-        self.anthropic = Anthropic()
+        self.anthropic = AsyncAnthropic()
         self.available_tools: List[ToolDefinition] = []
+        # Frozen copy of available_tools sent to Claude, built once all servers are connected
+        self._tools_payload: Tuple[dict, ...] = ()
+        # Tool overview shown when the chat starts, rendered alongside _tools_payload
+        self._tools_listing = ""
         self.tool_to_session: Dict[str, ClientSession] = {}
+        self.resource_to_session: Dict[str, ClientSession] = {}
+        self.resource_templates: List[Tuple[re.Pattern, ClientSession]] = []
+        self.prompt_to_session: Dict[str, ClientSession] = {}
         self.available_resources: List[str] = []
         self.available_prompts: List[str] = []
+        # Background prompt runs: job id -> (prompt name, task, captured output)
+        self._jobs: Dict[str, Tuple[str, asyncio.Task, io.StringIO]] = {}
+
+    async def __aenter__(self) -> "FinancialChatBot":
+        """Connect to every configured server; sessions stay open until exit."""
+        try:
+            await self.connect_to_servers()
+        except BaseException:
+            await self.cleanup()
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.cleanup()
 
     async def connect_to_server(self, server_name: str, server_config: dict) -> None:
         """Connect to a single MCP server."""
@@ -67,16 +146,28 @@ class FinancialChatBot:
                 resources_response = await session.list_resources()
                 resources = resources_response.resources
                 for resource in resources:
+                    self.resource_to_session[str(resource.uri)] = session
                     self.available_resources.append(resource.uri)
                 print(f"Available resources from {server_name}:", [r.uri for r in resources])
             except Exception as e:
                 logger.info(f"No resources available from {server_name}: {e}")
             
+            # List resource templates (e.g. finance://{filename})
+            try:
+                templates_response = await session.list_resource_templates()
+                for template in templates_response.resourceTemplates:
+                    self.resource_templates.append(
+                        (self._compile_uri_template(template.uriTemplate), session)
+                    )
+            except Exception as e:
+                logger.info(f"No resource templates available from {server_name}: {e}")
+            
             # List available prompts
             try:
                 prompts_response = await session.list_prompts()
                 prompts = prompts_response.prompts
                 for prompt in prompts:
+                    self.prompt_to_session[prompt.name] = session
                     self.available_prompts.append(prompt.name)
                 print(f"Available prompts from {server_name}:", [p.name for p in prompts])
             except Exception as e:
@@ -96,49 +187,86 @@ class FinancialChatBot:
             
             for server_name, server_config in servers.items():
                 await self.connect_to_server(server_name, server_config)
+            
+            self._tools_payload = self._build_tools_payload()
+            self._tools_listing = self._render_tools_listing()
         except Exception as e:
             print(f"Error loading server configuration: {e}")
             logger.error(f"Server configuration error: {e}")
             raise
 
+    def _build_tools_payload(self) -> Tuple[dict, ...]:
+        """Freeze available_tools for Claude, marking the last tool as a cache breakpoint."""
+        tools = [dict(tool) for tool in self.available_tools]
+        for tool in tools:
+            # Server docstrings arrive with their source indentation; drop it
+            # rather than pay for the whitespace on every turn
+            if tool["description"]:
+                tool["description"] = inspect.cleandoc(tool["description"])
+        if tools:
+            tools[-1]["cache_control"] = _CACHE_CONTROL
+        return tuple(tools)
+
+    def _render_tools_listing(self) -> str:
+        """Render the tool overview shown when the chat starts."""
+        if not self.available_tools:
+            return ""
+        
+        parts = ["\n🔧 Available tools:"]
+        parts.extend(
+            f"  - {tool['name']}: {tool['description'][:80]}..." for tool in self.available_tools
+        )
+        return "\n".join(parts)
+
     async def get_resource(self, resource_uri: str) -> str:
         """Get content from a resource."""
         try:
-            # Find the session that provides this resource
-            for session in self.sessions:
-                try:
-                    result = await session.read_resource(resource_uri)
-                    return result.contents[0].text if result.contents else "No content available"
-                except Exception:
-                    continue
-            return f"Resource not found: {resource_uri}"
+            session = self._find_resource_session(resource_uri)
+            if session is None:
+                return f"Resource not found: {resource_uri}"
+            
+            result = await session.read_resource(resource_uri)
+            return result.contents[0].text if result.contents else "No content available"
         except Exception as e:
             return f"Error retrieving resource: {str(e)}"
 
-    async def execute_prompt(self, prompt_name: str, arguments: Dict[str, str]) -> str:
-        """Execute a prompt template with given arguments."""
+    @staticmethod
+    def _compile_uri_template(uri_template: str) -> re.Pattern:
+        """Turn an RFC 6570 style template like finance://{filename} into a regex."""
+        return re.compile(re.sub(r'\\\{\w+\\\}', r'[^/]+', re.escape(uri_template)) + '$')
+
+    def _find_resource_session(self, resource_uri: str) -> Optional[ClientSession]:
+        """Look up the session that serves a resource URI."""
+        session = self.resource_to_session.get(resource_uri)
+        if session is not None:
+            return session
+        for pattern, template_session in self.resource_templates:
+            if pattern.match(resource_uri):
+                return template_session
+        return None
+
+    async def execute_prompt(self, prompt_name: str, arguments: Dict[str, str], out: Optional[TextIO] = None) -> str:
+        """Execute a prompt template with given arguments, writing the answer to out (stdout by default)."""
         try:
-            # Find the session that provides this prompt
-            for session in self.sessions:
-                try:
-                    result = await session.get_prompt(prompt_name, arguments)
-                    if result.messages:
-                        # Extract the prompt content and send to LLM
-                        prompt_content = ""
-                        for message in result.messages:
-                            if hasattr(message, 'content'):
-                                if hasattr(message.content, 'text'):
-                                    prompt_content += message.content.text
-                                else:
-                                    prompt_content += str(message.content)
-                        
-                        # Process the prompt with the LLM
-                        await self.process_query(prompt_content)
-                        return ""
-                    return "No prompt content received"
-                except Exception:
-                    continue
-            return f"Prompt not found: {prompt_name}"
+            session = self.prompt_to_session.get(prompt_name)
+            if session is None:
+                return f"Prompt not found: {prompt_name}"
+            
+            result = await session.get_prompt(prompt_name, arguments)
+            if result.messages:
+                # Extract the prompt content and send to LLM
+                prompt_content = ""
+                for message in result.messages:
+                    if hasattr(message, 'content'):
+                        if hasattr(message.content, 'text'):
+                            prompt_content += message.content.text
+                        else:
+                            prompt_content += str(message.content)
+                
+                # Process the prompt with the LLM
+                await self.process_query(prompt_content, out)
+                return ""
+            return "No prompt content received"
         except Exception as e:
             return f"Error executing prompt: {str(e)}"
 
@@ -151,15 +279,60 @@ class FinancialChatBot:
         for prompt in self.available_prompts:
             content += f"- {prompt}\n"
         content += "\nUsage: /prompt <name> <arg1=value1> <arg2=value2>"
+        content += "\nAppend ' &' to run a prompt in the background (see /jobs)"
         return content
 
+    def start_prompt_job(self, prompt_name: str, arguments: Dict[str, str]) -> str:
+        """Run a prompt in a background task, capturing its output; returns the job id."""
+        job_id = uuid.uuid4().hex[:8]
+        output = io.StringIO()
+        task = asyncio.create_task(self.execute_prompt(prompt_name, arguments, output))
+        self._jobs[job_id] = (prompt_name, task, output)
+        return job_id
+
+    def list_jobs(self) -> str:
+        """List background prompt jobs and their state."""
+        if not self._jobs:
+            return "No background jobs."
+        
+        content = "Background jobs:\n"
+        for job_id, (prompt_name, task, _) in self._jobs.items():
+            if not task.done():
+                state = "running"
+            elif task.cancelled():
+                # exception() raises CancelledError on a cancelled task
+                state = "cancelled"
+            else:
+                state = "failed" if task.exception() else "done"
+            content += f"- {job_id}: {prompt_name} ({state})\n"
+        content += "\nUsage: /result <id>"
+        return content
+
+    def job_result(self, job_id: str) -> str:
+        """Return a finished job's captured output, forgetting the job."""
+        job = self._jobs.get(job_id)
+        if job is None:
+            return f"No such job: {job_id}"
+        
+        prompt_name, task, output = job
+        if not task.done():
+            return f"Job {job_id} ({prompt_name}) is still running"
+        
+        del self._jobs[job_id]
+        if task.cancelled():
+            return f"Job {job_id} was cancelled"
+        if task.exception():
+            return f"Job {job_id} failed: {task.exception()}"
+        # execute_prompt reports its own errors through the return value
+        return output.getvalue() + task.result()
+
     def parse_prompt_command(self, user_input: str) -> tuple:
         """Parse prompt command from user input."""
         # Remove /prompt prefix
         command = user_input[7:].strip()  # Remove '/prompt '
         
         # Split by spaces but handle quoted arguments
-        parts = re.findall(r'(\w+(?:=(?:"[^"]*"|[^\s]+))?)', command)
+        parts = _PROMPT_RE.findall(command)
         
         if not parts:
             return None, {}
@@ -177,93 +350,84 @@ class FinancialChatBot:
         
         return prompt_name, arguments
     
-    async def process_query(self, query):
-        """Process a user query using available tools."""
+    async def process_query(self, query, out: Optional[TextIO] = None):
+        """Process a user query using available tools, writing the answer to out (stdout by default)."""
+        out = out or sys.stdout
         messages = [{'role':'user', 'content':query}]
-        response = self.anthropic.messages.create(
+        response = await self._stream_message(messages, out)
+        
+        while True:
+            tool_uses = [content for content in response.content if content.type == 'tool_use']
+            if any(content.type == 'text' for content in response.content):
+                # Text was printed while streaming; end the line
+                print(file=out)
+            
+            if not tool_uses:
+                break
+            
+            # Answer every tool_use of this turn in a single user message,
+            # running the tools concurrently; results keep the original order
+            messages.append({'role':'assistant', 'content':list(response.content)})
+            tool_results = await asyncio.gather(
+                *(self._invoke_tool(content, out) for content in tool_uses)
+            )
+            messages.append({'role':'user', 'content':list(tool_results)})
+            
+            response = await self._stream_message(messages, out)
+
+    async def _invoke_tool(self, content, out: TextIO) -> dict:
+        """Run a single tool_use block, returning its tool_result block."""
+        tool_name = content.name
+        tool_args = content.input
+        print(f"\n🔧 Calling tool {tool_name} with args {tool_args}", file=out)
+        
+        # Call a tool using the appropriate session
+        try:
+            session = self.tool_to_session[tool_name]
+            result = await session.call_tool(tool_name, arguments=tool_args)
+            print(f"✅ Tool result received", file=out)
+            tool_content = result.content
+        except Exception as e:
+            tool_content = f"Error calling tool {tool_name}: {str(e)}"
+            print(f"❌ {tool_content}", file=out)
+        
+        return {
+            "type": "tool_result",
+            "tool_use_id": content.id,
+            "content": tool_content
+        }
+
+    async def _stream_message(self, messages: list, out: TextIO):
+        """Stream a Claude response to out as it arrives and return the final message."""
+        async with self.anthropic.messages.stream(
             max_tokens = 4096,
-            model = 'claude-3-5-sonnet-20241022', 
-            tools = self.available_tools,
+            model = 'claude-3-5-sonnet-20241022',
+            tools = self._tools_payload,
             messages = messages
-        )
-        
-        process_query = True
-        while process_query:
-            assistant_content = []
-            for content in response.content:
-                if content.type =='text':
-                    print(content.text)
-                    assistant_content.append(content)
-                    if(len(response.content) == 1):
-                        process_query= False
-                elif content.type == 'tool_use':
-                    assistant_content.append(content)
-                    messages.append({'role':'assistant', 'content':assistant_content})
-                    tool_id = content.id
-                    tool_args = content.input
-                    tool_name = content.name
-
-                    print(f"\n🔧 Calling tool {tool_name} with args {tool_args}")
-                    
-                    # Call a tool using the appropriate session
-                    try:
-                        session = self.tool_to_session[tool_name]
-                        result = await session.call_tool(tool_name, arguments=tool_args)
-                        print(f"✅ Tool result received")
-                        
-                        messages.append({"role": "user", 
-                                          "content": [
-                                              {
-                                                  "type": "tool_result",
-                                                  "tool_use_id":tool_id,
-                                                  "content": result.content
-                                              }
-                                          ]
-                                        })
-                    except Exception as e:
-                        error_msg = f"Error calling tool {tool_name}: {str(e)}"
-                        print(f"❌ {error_msg}")
-                        messages.append({"role": "user", 
-                                          "content": [
-                                              {
-                                                  "type": "tool_result",
-                                                  "tool_use_id":tool_id,
-                                                  "content": error_msg
-                                              }
-                                          ]
-                                        })
-                    
-                    response = self.anthropic.messages.create(
-                        max_tokens = 4096,
-                        model = 'claude-3-5-sonnet-20241022', 
-                        tools = self.available_tools,
-                        messages = messages
-                    ) 
-                    
-                    if(len(response.content) == 1 and response.content[0].type == "text"):
-                        print(response.content[0].text)
-                        process_query= False
+        ) as stream:
+            # Buffer deltas and flush on a timer instead of once per token
+            last_flush = time.monotonic()
+            async for text in stream.text_stream:
+                out.write(text)
+                now = time.monotonic()
+                if now - last_flush >= _FLUSH_INTERVAL:
+                    out.flush()
+                    last_flush = now
+            out.flush()
+            return await stream.get_final_message()
 
     async def chat_loop(self):
         """Run an interactive chat loop with financial commands."""
-        print("\n💰 Financial MCP Chatbot Started!")
-        print("=" * 50)
-        print("Available commands:")
-        print("📊 Regular queries: Ask about stocks, markets, analysis")
-        print("📁 Resources: @portfolios, @<filename>")
-        print("📝 Prompts: /prompts, /prompt <name> <args>")
-        print("❌ Exit: type 'quit'")
-        print("=" * 50)
+        print(_BANNER)
         
         # Show available tools
-        if self.available_tools:
-            print("\n🔧 Available tools:")
-            for tool in self.available_tools:
-                print(f"  - {tool['name']}: {tool['description'][:80]}...")
+        if self._tools_listing:
+            print(self._tools_listing)
         
         while True:
             try:
-                query = input("\n💭 Query: ").strip()
+                # Read input off the event loop so background jobs keep running
+                query = (await _read_input("\n💭 Query: ")).strip()
         
                 if query.lower() == 'quit':
                     print("👋 Goodbye!")
@@ -284,9 +448,24 @@ class FinancialChatBot:
                     print(self.list_prompts())
                     continue
                 
+                if query == '/jobs':
+                    print(self.list_jobs())
+                    continue
+                
+                if query.startswith('/result '):
+                    print(self.job_result(query[8:].strip()))
+                    continue
+                
                 if query.startswith('/prompt '):
-                    prompt_name, arguments = self.parse_prompt_command(query)
-                    if prompt_name:
+                    # A trailing '&' runs the prompt in the background
+                    background = query.endswith('&')
+                    # Drop only the '&' marker; an argument may itself end in '&'
+                    command = query[:-1].rstrip() if background else query
+                    prompt_name, arguments = self.parse_prompt_command(command)
+                    if prompt_name and background:
+                        job_id = self.start_prompt_job(prompt_name, arguments)
+                        print(f"⏳ Started job {job_id}; check it with /jobs or /result {job_id}")
+                    elif prompt_name:
                         await self.execute_prompt(prompt_name, arguments)
                     else:
                         print("Invalid prompt format. Use: /prompt <name> <arg1=value1>")
@@ -295,30 +474,34 @@ class FinancialChatBot:
                 # Regular query processing
                 await self.process_query(query)
                         
-            except KeyboardInterrupt:
-                print("\n👋 Goodbye!")
-                break
             except Exception as e:
                 print(f"\n❌ Error: {str(e)}")
                 logger.error(f"Chat loop error: {e}")
 
     async def cleanup(self):
         """Cleanly close all resources using AsyncExitStack."""
+        # Stop unfinished background jobs before their sessions close
+        tasks = [task for _, task, _ in self._jobs.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
         await self.exit_stack.aclose()
         print("🧹 Cleaned up all connections")
 
 async def main():
     """Main entry point for the financial chatbot."""
-    chatbot = FinancialChatBot()
     try:
         print("🚀 Starting Financial MCP Chatbot...")
-        await chatbot.connect_to_servers()
-        await chatbot.chat_loop()
+        # One session per server, shared by every query until the chat ends
+        async with FinancialChatBot() as chatbot:
+            await chatbot.chat_loop()
     except Exception as e:
         print(f"❌ Fatal error: {e}")
         logger.error(f"Main execution error: {e}")
-    finally:
-        await chatbot.cleanup()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        # Ctrl-C: main() has already cleaned up on the way out
+        print("\n👋 Goodbye!")
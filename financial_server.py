@@ -1,22 +1,203 @@
-import yfinance as yf
+import asyncio
+import concurrent.futures
+import functools
+import gzip
+import hashlib
+import inspect
 import json
 import os
-import pandas as pd
+import time
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional, Union
+from typing import TYPE_CHECKING, Any, Callable, List, Dict, Optional, Union
 from mcp.server.fastmcp import FastMCP
 import logging
 
+# yfinance (and the pandas it pulls in) take a second or more to import, so
+# tools import it on first use and the server answers initialize/list_tools
+# straight away
+if TYPE_CHECKING:
+    import pandas as pd
+
+try:
+    import orjson
+    
+    def _dumps(obj: Any, indent: bool = True) -> str:
+        """Serialize a payload as JSON, indented by two spaces or compact."""
+        option = orjson.OPT_SERIALIZE_NUMPY | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(obj, option=option).decode()
+except ImportError:  # orjson is an optional speedup
+    def _dumps(obj: Any, indent: bool = True) -> str:
+        """Serialize a payload as JSON, indented by two spaces or compact."""
+        if indent:
+            return json.dumps(obj, indent=2)
+        return json.dumps(obj, separators=(',', ':'))
+
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 FINANCE_DIR = "financial_data"
+CACHE_DIR = ".cache"
+
+os.makedirs(FINANCE_DIR, exist_ok=True)
+
+# Saved data files are written by one background thread, in submission order,
+# so tools return without waiting on disk
+_file_writer = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="finance-writer")
+# SHA-1 of the JSON each data file was last written with
+_written_hashes: Dict[str, str] = {}
+
+def _write_data_file(filename: str, obj: Any) -> None:
+    """
+    Atomically write a data file as compact JSON, gzipped for .json.gz names,
+    unless it already holds exactly this data.
+    """
+    data = _dumps(obj, indent=False).encode()
+    digest = hashlib.sha1(data).hexdigest()
+    if _written_hashes.get(filename) == digest and os.path.exists(filename):
+        return
+    if filename.endswith('.gz'):
+        data = gzip.compress(data)
+    try:
+        tmp_path = f"{filename}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, filename)
+        _written_hashes[filename] = digest
+    except OSError as e:
+        logger.error(f"Could not save {filename}: {e}")
+
+def _save_data_file(filename: str, obj: Any) -> None:
+    """Queue a data file write on the background writer; obj must not be changed afterwards."""
+    _file_writer.submit(_write_data_file, filename, obj)
+
+# Seconds a cached tool result stays fresh. Quotes move quickly; daily bars
+# and company metadata barely change within a chat session.
+_CACHE_TTL = {
+    "get_stock_info": 900,
+    "get_historical_data": 86400,
+    "get_historical_data_intraday": 60,
+    "compare_stocks": 900,
+    "get_market_summary": 60,
+}
+_INTRADAY_INTERVALS = frozenset({"1m", "2m", "5m", "15m", "30m", "60m", "90m", "1h"})
+
+def _cache_ttl(tool_name: str, arguments: Dict[str, Any]) -> int:
+    """Pick the cache lifetime for one tool call."""
+    if tool_name == "get_historical_data" and arguments.get("interval") in _INTRADAY_INTERVALS:
+        return _CACHE_TTL["get_historical_data_intraday"]
+    return _CACHE_TTL[tool_name]
+
+def _normalize_args(arguments: Dict[str, Any]) -> Dict[str, Any]:
+    """Normalize tool arguments so 'aapl' and 'AAPL' share a cache entry."""
+    normalized = dict(arguments)
+    if isinstance(normalized.get("symbol"), str):
+        normalized["symbol"] = normalized["symbol"].strip().upper()
+    if isinstance(normalized.get("symbols"), list):
+        normalized["symbols"] = [str(symbol).strip().upper() for symbol in normalized["symbols"]]
+    return normalized
+
+def _read_cache(path: str, ttl: int) -> Optional[str]:
+    """Return a cached payload if the entry exists and is younger than ttl seconds."""
+    try:
+        if time.time() - os.stat(path).st_mtime > ttl:
+            return None
+        with open(path, 'r') as f:
+            return json.load(f)["payload"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+def _is_failure(payload: str) -> bool:
+    """True for an error result, or one where any per-symbol entry failed."""
+    if payload.startswith('{"error"'):
+        return True
+    # Successful results carry no "error" key, so most payloads skip the parse
+    if '"error"' not in payload:
+        return False
+    data = json.loads(payload)
+    return any(
+        isinstance(entry, dict) and 'error' in entry
+        for key in ('stocks', 'indices')
+        for entry in data.get(key, ())
+    )
+
+def _write_cache(path: str, payload: str) -> None:
+    """Atomically store a payload so concurrent readers never see a partial file."""
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({"ts": time.time(), "payload": payload}, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Could not write cache entry {path}: {e}")
+
+def _cached(func: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    Serve a tool's JSON result from CACHE_DIR while it is fresh.
+    
+    Entries live at .cache/<tool>/<md5 of the normalized arguments>.json, so
+    retries and follow-up questions don't repeat the Yahoo round trip.
+    Works for both plain and async tools.
+    """
+    signature = inspect.signature(func)
+    
+    def lookup(args: tuple, kwargs: dict) -> tuple:
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        arguments = _normalize_args(bound.arguments)
+        key = hashlib.md5(json.dumps(arguments, sort_keys=True).encode()).hexdigest()
+        path = os.path.join(CACHE_DIR, func.__name__, f"{key}.json")
+        
+        payload = _read_cache(path, _cache_ttl(func.__name__, arguments))
+        if payload is not None:
+            logger.info(f"Serving {func.__name__} from cache")
+        return path, payload
+    
+    def store(path: str, payload: str) -> None:
+        # Failures, including a transient error for one of several symbols,
+        # are retried on the next call instead of being cached
+        if not _is_failure(payload):
+            _write_cache(path, payload)
+    
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs) -> str:
+            # Keep cache file I/O off the event loop
+            path, payload = await asyncio.to_thread(lookup, args, kwargs)
+            if payload is None:
+                payload = await func(*args, **kwargs)
+                _file_writer.submit(store, path, payload)
+            return payload
+        
+        return async_wrapper
+    
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs) -> str:
+        path, payload = lookup(args, kwargs)
+        if payload is None:
+            payload = func(*args, **kwargs)
+            store(path, payload)
+        return payload
+    
+    return wrapper
+
+# Most yfinance requests in flight at once, so large symbol lists don't trip
+# Yahoo's rate limits. A dedicated pool keeps yfinance work from competing
+# with other users of the default executor.
+_YF_CONCURRENCY = 8
+_yf_pool = concurrent.futures.ThreadPoolExecutor(max_workers=_YF_CONCURRENCY, thread_name_prefix="yf")
+
+async def _run_yf(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run a blocking yfinance call on the bounded yfinance thread pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_yf_pool, functools.partial(func, *args, **kwargs))
 
 # Initialize FastMCP server
 mcp = FastMCP("finance")
 
 @mcp.tool()
+@_cached
 def get_stock_info(symbol: str) -> str:
     """
     Get basic information about a stock including current price, market cap, and key metrics.
@@ -28,6 +209,8 @@ def get_stock_info(symbol: str) -> str:
         JSON string with stock information
     """
     try:
+        import yfinance as yf
+        
         stock = yf.Ticker(symbol.upper())
         info = stock.info
         
@@ -50,13 +233,12 @@ def get_stock_info(symbol: str) -> str:
         }
         
         # Save to file
-        os.makedirs(FINANCE_DIR, exist_ok=True)
         filename = os.path.join(FINANCE_DIR, f"{symbol.upper()}_info.json")
-        with open(filename, 'w') as f:
-            json.dump(stock_data, f, indent=2)
+        _save_data_file(filename, stock_data)
+        payload = _dumps(stock_data)
         
         logger.info(f"Stock info for {symbol} saved to {filename}")
-        return json.dumps(stock_data, indent=2)
+        return payload
         
     except Exception as e:
         error_msg = f"Error fetching stock info for {symbol}: {str(e)}"
@@ -64,6 +246,7 @@ def get_stock_info(symbol: str) -> str:
         return json.dumps({"error": error_msg})
 
 @mcp.tool()
+@_cached
 def get_historical_data(symbol: str, period: str = "1mo", interval: str = "1d") -> str:
     """
     Get historical stock price data for a given symbol.
@@ -77,6 +260,8 @@ def get_historical_data(symbol: str, period: str = "1mo", interval: str = "1d")
         JSON string with historical price data
     """
     try:
+        import yfinance as yf
+        
         stock = yf.Ticker(symbol.upper())
         hist = stock.history(period=period, interval=interval)
         
@@ -91,32 +276,52 @@ def get_historical_data(symbol: str, period: str = "1mo", interval: str = "1d")
             'data': []
         }
         
-        for date, row in hist.iterrows():
-            hist_data['data'].append({
-                'date': date.strftime('%Y-%m-%d'),
-                'open': float(row['Open']),
-                'high': float(row['High']),
-                'low': float(row['Low']),
-                'close': float(row['Close']),
-                'volume': int(row['Volume']) if pd.notna(row['Volume']) else 0
-            })
+        # Convert whole columns at once rather than boxing every row
+        bars = hist[['Open', 'High', 'Low', 'Close']].astype('float64')
+        bars.columns = ['open', 'high', 'low', 'close']
+        bars['volume'] = hist['Volume'].fillna(0).astype('int64')
+        bars.insert(0, 'date', hist.index.strftime('%Y-%m-%d'))
+        hist_data['data'] = bars.to_dict(orient='records')
         
         # Save to file
-        os.makedirs(FINANCE_DIR, exist_ok=True)
-        filename = os.path.join(FINANCE_DIR, f"{symbol.upper()}_historical_{period}_{interval}.json")
-        with open(filename, 'w') as f:
-            json.dump(hist_data, f, indent=2)
+        filename = os.path.join(FINANCE_DIR, f"{symbol.upper()}_historical_{period}_{interval}.json.gz")
+        _save_data_file(filename, hist_data)
+        payload = _dumps(hist_data)
         
         logger.info(f"Historical data for {symbol} saved to {filename}")
-        return json.dumps(hist_data, indent=2)
+        return payload
         
     except Exception as e:
         error_msg = f"Error fetching historical data for {symbol}: {str(e)}"
         logger.error(error_msg)
         return json.dumps({"error": error_msg})
 
+def _fetch_metric(symbol: str, metric: str) -> dict:
+    """Fetch one stock's comparison entry (blocking yfinance call)."""
+    import yfinance as yf
+    
+    stock = yf.Ticker(symbol.upper())
+    info = stock.info
+    
+    stock_metric = {
+        'symbol': symbol.upper(),
+        'name': info.get('longName', 'N/A'),
+        'metric_value': info.get(metric, 'N/A')
+    }
+    
+    # Add additional context based on metric
+    if metric == 'current_price':
+        stock_metric['currency'] = info.get('currency', 'USD')
+    elif metric == 'market_cap':
+        stock_metric['currency'] = info.get('currency', 'USD')
+    elif metric == 'pe_ratio':
+        stock_metric['description'] = 'Price-to-Earnings Ratio'
+    
+    return stock_metric
+
 @mcp.tool()
-def compare_stocks(symbols: List[str], metric: str = "current_price") -> str:
+@_cached
+async def compare_stocks(symbols: List[str], metric: str = "current_price") -> str:
     """
     Compare multiple stocks based on a specific metric.
     
@@ -134,32 +339,19 @@ def compare_stocks(symbols: List[str], metric: str = "current_price") -> str:
             'stocks': []
         }
         
-        for symbol in symbols:
-            try:
-                stock = yf.Ticker(symbol.upper())
-                info = stock.info
-                
-                stock_metric = {
-                    'symbol': symbol.upper(),
-                    'name': info.get('longName', 'N/A'),
-                    'metric_value': info.get(metric, 'N/A')
-                }
-                
-                # Add additional context based on metric
-                if metric == 'current_price':
-                    stock_metric['currency'] = info.get('currency', 'USD')
-                elif metric == 'market_cap':
-                    stock_metric['currency'] = info.get('currency', 'USD')
-                elif metric == 'pe_ratio':
-                    stock_metric['description'] = 'Price-to-Earnings Ratio'
-                
-                comparison_data['stocks'].append(stock_metric)
-                
-            except Exception as e:
+        # Fetch all symbols concurrently; results come back in input order
+        results = await asyncio.gather(
+            *(_run_yf(_fetch_metric, symbol, metric) for symbol in symbols),
+            return_exceptions=True
+        )
+        for symbol, result in zip(symbols, results):
+            if isinstance(result, Exception):
                 comparison_data['stocks'].append({
                     'symbol': symbol.upper(),
-                    'error': str(e)
+                    'error': str(result)
                 })
+            else:
+                comparison_data['stocks'].append(result)
         
         # Sort by metric value (handle N/A values)
         comparison_data['stocks'].sort(
@@ -168,21 +360,39 @@ def compare_stocks(symbols: List[str], metric: str = "current_price") -> str:
         )
         
         # Save to file
-        os.makedirs(FINANCE_DIR, exist_ok=True)
         filename = os.path.join(FINANCE_DIR, f"comparison_{metric}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
-        with open(filename, 'w') as f:
-            json.dump(comparison_data, f, indent=2)
+        _save_data_file(filename, comparison_data)
+        payload = _dumps(comparison_data)
         
         logger.info(f"Stock comparison saved to {filename}")
-        return json.dumps(comparison_data, indent=2)
+        return payload
         
     except Exception as e:
         error_msg = f"Error comparing stocks: {str(e)}"
         logger.error(error_msg)
         return json.dumps({"error": error_msg})
 
+def _summarize_index(symbol: str, name: str, closes: "pd.Series") -> Optional[dict]:
+    """Turn an index's recent closes into its latest price and daily change."""
+    if closes.empty:
+        return None
+    
+    current_price = closes.iloc[-1]
+    previous_price = closes.iloc[-2] if len(closes) > 1 else current_price
+    change = current_price - previous_price
+    change_percent = (change / previous_price) * 100 if previous_price != 0 else 0
+    
+    return {
+        'symbol': symbol,
+        'name': name,
+        'current_price': float(current_price),
+        'change': float(change),
+        'change_percent': float(change_percent)
+    }
+
 @mcp.tool()
-def get_market_summary() -> str:
+@_cached
+async def get_market_summary() -> str:
     """
     Get summary of major market indices.
     
@@ -203,49 +413,48 @@ def get_market_summary() -> str:
             'indices': []
         }
         
+        import yfinance as yf
+        
+        # One batched request for all indices instead of one per index
+        hist = await _run_yf(
+            yf.download, list(indices), period="2d", interval="1d",
+            group_by='ticker', threads=True, progress=False
+        )
         for symbol, name in indices.items():
             try:
-                ticker = yf.Ticker(symbol)
-                info = ticker.info
-                hist = ticker.history(period="2d")
-                
-                if not hist.empty:
-                    current_price = hist['Close'].iloc[-1]
-                    previous_price = hist['Close'].iloc[-2] if len(hist) > 1 else current_price
-                    change = current_price - previous_price
-                    change_percent = (change / previous_price) * 100 if previous_price != 0 else 0
-                    
-                    index_data = {
-                        'symbol': symbol,
-                        'name': name,
-                        'current_price': float(current_price),
-                        'change': float(change),
-                        'change_percent': float(change_percent)
-                    }
-                    
-                    market_data['indices'].append(index_data)
-                    
+                # Indices trade on different calendars; drop the other days' gaps
+                index_data = _summarize_index(symbol, name, hist[symbol]['Close'].dropna())
             except Exception as e:
                 market_data['indices'].append({
                     'symbol': symbol,
                     'name': name,
                     'error': str(e)
                 })
+                continue
+            
+            if index_data is not None:
+                market_data['indices'].append(index_data)
         
         # Save to file
-        os.makedirs(FINANCE_DIR, exist_ok=True)
         filename = os.path.join(FINANCE_DIR, f"market_summary_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
-        with open(filename, 'w') as f:
-            json.dump(market_data, f, indent=2)
+        _save_data_file(filename, market_data)
+        payload = _dumps(market_data)
         
         logger.info(f"Market summary saved to {filename}")
-        return json.dumps(market_data, indent=2)
+        return payload
         
     except Exception as e:
         error_msg = f"Error fetching market summary: {str(e)}"
         logger.error(error_msg)
         return json.dumps({"error": error_msg})
 
+# Saved data files: plain JSON, or gzipped JSON for large historical series
+_DATA_SUFFIXES = ('.json', '.json.gz')
+
+# Rendered portfolio listing and the FINANCE_DIR mtime it was built from;
+# adding, removing or renaming a file changes the directory's mtime
+_portfolios_listing: Dict[str, Any] = {"mtime": None, "content": ""}
+
 @mcp.resource("finance://portfolios")
 def get_available_portfolios() -> str:
     """
@@ -253,12 +462,18 @@ def get_available_portfolios() -> str:
     
     This resource provides a list of all saved portfolio data files.
     """
-    portfolios = []
+    try:
+        mtime = os.stat(FINANCE_DIR).st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
     
-    if os.path.exists(FINANCE_DIR):
-        for file in os.listdir(FINANCE_DIR):
-            if file.endswith('.json'):
-                portfolios.append(file)
+    if mtime is not None and mtime == _portfolios_listing["mtime"]:
+        return _portfolios_listing["content"]
+    
+    portfolios = []
+    if mtime is not None:
+        with os.scandir(FINANCE_DIR) as entries:
+            portfolios = [entry.name for entry in entries if entry.name.endswith(_DATA_SUFFIXES)]
     
     content = "# Available Financial Data\\n\\n"
     if portfolios:
@@ -268,23 +483,23 @@ def get_available_portfolios() -> str:
     else:
         content += "No financial data found.\\n"
     
+    _portfolios_listing["mtime"] = mtime
+    _portfolios_listing["content"] = content
     return content
 
-@mcp.resource("finance://{filename}")
-def get_financial_data(filename: str) -> str:
+@functools.lru_cache(maxsize=128)
+def _render_financial_data(filename: str, mtime_ns: int, size: int) -> str:
     """
-    Get specific financial data from a saved file.
+    Render a saved data file as markdown.
     
-    Args:
-        filename: The name of the financial data file to retrieve
+    The file's mtime and size are part of the cache key, so a rewritten file
+    is read and rendered again while repeated reads are served from memory.
     """
     file_path = os.path.join(FINANCE_DIR, filename)
     
-    if not os.path.exists(file_path):
-        return f"# Financial data file not found: {filename}\\n\\nAvailable files can be viewed with @portfolios"
-    
     try:
-        with open(file_path, 'r') as f:
+        opener = gzip.open if filename.endswith('.gz') else open
+        with opener(file_path, 'rt') as f:
             data = json.load(f)
         
         # Create markdown content based on data type
@@ -308,13 +523,30 @@ def get_financial_data(filename: str) -> str:
         else:
             # Generic JSON format
             content = f"# Financial Data: {filename}\\n\\n"
-            content += f"```json\\n{json.dumps(data, indent=2)}\\n```\\n"
+            content += f"```json\\n{_dumps(data)}\\n```\\n"
         
         return content
         
-    except json.JSONDecodeError:
+    except (json.JSONDecodeError, gzip.BadGzipFile, EOFError):
         return f"# Error reading financial data: {filename}\\n\\nThe data file is corrupted."
 
+@mcp.resource("finance://{filename}")
+def get_financial_data(filename: str) -> str:
+    """
+    Get specific financial data from a saved file.
+    
+    Args:
+        filename: The name of the financial data file to retrieve
+    """
+    file_path = os.path.join(FINANCE_DIR, filename)
+    
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return f"# Financial data file not found: {filename}\\n\\nAvailable files can be viewed with @portfolios"
+    
+    return _render_financial_data(filename, stat.st_mtime_ns, stat.st_size)
+
 @mcp.prompt()
 def analyze_stock_prompt(symbol: str, analysis_type: str = "comprehensive") -> str:
     """Generate a prompt for comprehensive stock analysis."""
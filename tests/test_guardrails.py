@@ -0,0 +1,21 @@
+from enhanced_version.guardrails import FinancialGuardrails, RiskLevel
+
+
+def test_blocked_keyword_matched_through_unicode_case_folding():
+    # IGNORECASE matches 'İ' and 'ſ' against 'i' and 's', but their .lower()
+    # is not the keyword's lowercase form; the match must still name the keyword
+    guardrails = FinancialGuardrails()
+    
+    for query, keyword in (
+        ('İnsider info please', 'insider info'),
+        ('inſider trading', 'insider trading'),
+        ('Tell me about INSIDER TRADING', 'insider trading'),
+    ):
+        is_valid, violation, risk_level = guardrails.validate_query(query)
+        assert not is_valid
+        assert violation.details == {"blocked_keyword": keyword}
+        assert risk_level == RiskLevel.HIGH
+
+
+def test_plain_query_passes():
+    assert FinancialGuardrails().validate_query('What is the price of AAPL?') == (True, None, RiskLevel.LOW)